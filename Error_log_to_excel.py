@@ -1,14 +1,32 @@
 import zipfile
 import os
 import re
-import pandas as pd
-import tempfile
+from array import array
+import io
 import datetime
 from pathlib import Path
 import json
 import math
 import argparse
-import xlsxwriter
+import concurrent.futures
+import concurrent.futures.process
+import sqlite3
+import hashlib
+import time as time_module
+import contextlib
+import csv
+import threading
+import collections
+import cProfile
+import pstats
+import codecs
+import gzip
+import heapq
+import bisect
+import zlib
+import platform
+import sys
+# pandas and xlsxwriter are imported where the output is written, they are most of the startup time
 
 #---------------------------default settings----------------------------------
 direct_run = False
@@ -32,19 +50,113 @@ default_error_types = {
     "logout(remote)": "远程重启",
     "logout(user)": "确认了退出操作"
 }
+# zip cache: classified rows of each zip are kept so unchanged zips are not parsed again
+use_cache = True
+rebuild_cache = False
+cache_location = 'cache/zip_cache.sqlite'
+cache_max_entries = 20000   # least recently used zips are evicted above this
+cache_max_age_days = 30     # zips not seen for this long are evicted
+# write rows to the xlsx while zips are processed instead of keeping them all in memory (--stream)
+stream_excel = False
+# long runs: every processed zip is written to the journal, --resume goes on from it after a crash / Ctrl+C
+journal_location = 'cache/run_journal.jsonl'
+resume_run = False
+# a zip failing with an error other than a bad zip is retried (OSError only: locked / network / OneDrive files),
+# then left out of the run and listed in the failure report (<output>_failures.json)
+zip_retries = 2
+zip_retry_delay = 2.0   # seconds, doubled at every retry
+# a log file found again in another zip of the same machine (same name, CRC and size, e.g. in two export folders)
+# is only parsed once per run (--no-dedup to parse every copy)
+dedup_logs = True
+# summary sheets (counts per library x error type, machine x day, abnormal boot rate, machines without events)
+summary_sheets = True   # --no-summary
+raw_rows = True         # --no-raw-rows: only the summary sheets, for runs with too many rows for excel
+# event history: per machine / day / error type counts of every run are kept in history_location, with a baseline per
+# machine and error type (EWMA over its days); days far above the baseline are listed in the Anomalies sheet (--no-history)
+update_history = True
+history_location = 'cache/event_history.sqlite'
+history_span_days = 30      # EWMA span of the baselines, in days with a log file
+anomaly_z = 3.0             # count at least this many standard deviations above the baseline
+anomaly_min_count = 3       # and at least this many events that day
+anomaly_min_days = 7        # days a baseline needs before it flags anything
+anomaly_ignore_types = ('First boot', 'Normal boot', 'scheduled boot')
+# run metrics (--metrics-out / --trace-out), nothing is counted when both are off
+metrics_out = None
+trace_out = None
+metrics_top_n = 10
+# follow mode (--follow): live events of an unzipped log folder
+follow_sink = 'live/events.csv'     # .csv, .jsonl or .sqlite
+follow_checkpoint_location = 'cache/follow_checkpoint.json'
+follow_poll_interval = 0.5  # seconds
+# prefetch (--prefetch N): N threads read the next zips into memory while the current one is parsed
+prefetch_threads = 0
+prefetch_budget_mb = 512    # zips held in memory at once (one bigger zip is still read alone)
+# chunked mode (--chunk-workers N): log files bigger than chunk_threshold_mb are matched in pieces by N processes
+chunk_workers = 0
+chunk_threshold_mb = 64
+# --workers: a zip goes to the workers once the memory it needs (estimated from its central directory) fits in the
+# budget next to the zips already running; a zip needing more than the whole budget runs alone, and going through the
+# folder waits meanwhile, so finished results do not pile up either. A log file bigger than the budget is never read
+# whole for chunked mode, it is streamed instead
+memory_budget_mb = 2048
+# log files without a BOM are read in the first of these encodings their lines decode in (GBK logs read as gb18030)
+log_encodings = ('utf-8', 'gb18030')
+# shard mode (--shard K/N): several hosts go through one shared folder, each writing the zips of its shard to a partial,
+# then --merge makes the output from all the partials; zips go to a shard by library or by machine name (crc32), so
+# the zips of a machine always stay in the same shard
+shard = None            # (K, N)
+shard_by = 'library'    # 'library' or 'machine' (more even when the libraries differ in size)
+# rule sets (--rules a.json b.json) instead of error_types.json: named sets of rules with a priority, a literal / regex
+# flag and a role (boot, normal_shutdown, remote_restart), validated and compiled once into rules_cache_location (by
+# content hash). Every rule set is matched in the same pass over the lines, roles are taken from the first one
+rule_set_paths = []
+rules_cache_location = 'cache/rules'
 #--------------------------------end of default------------------------------
 #--------------------------start of some global var--------------------------
-normal_boot_indicator_time = False
 abnormal_boot_list = {}
 # Regular expression to match date in filename (e.g., 2025-02-10)
 date_pattern = r'(\d{4}-\d{2}-\d{2})'
-# Initialize list to store all error data
-all_local_error_logs = []
+# all error data is kept in all_local_error_logs, an EventStore (created below the class)
+error_cols = ['Library', 'Machine', 'Date', 'Time', 'Error Type']
 invalid_zip = []
+failed_zips = []    #{'zip_path', 'error', 'message', 'attempts'} of the zips that failed after the retries
 lib_machines_count = {
         "all library": 0
     }
+cache_hits = 0
+seen_logs = {}  #(machine, log file name, CRC, size) -> first zip with it, for dedup_logs (None: given up by a broken zip)
+skipping_logs = collections.Counter()   #seen_logs key -> zips skipping it that are not merged yet
+planned_skips = {}  #zip path -> {log file name: seen_logs key} of the log files it skips, until it is merged
+duplicate_logs_skipped = 0
+run_summary = None  #RunSummary of the run when summary sheets are written
+run_history = None  #EventHistory of the run when update_history is on
+shard_partial = None    #ShardPartial of a shard run, zip results go to it instead of the output
 #--------------------------end of some global var--------------------------
+def reset_run_state():
+    """Empty the results of a previous run, so several runs can be done in one process."""
+    global all_local_error_logs
+    global cache_hits
+    global date_index_skips
+    global run_summary
+    global run_history
+    global shard_partial
+    global duplicate_logs_skipped
+    all_local_error_logs = EventStore()
+    run_summary = None
+    run_history = None
+    shard_partial = None
+    seen_logs.clear()
+    skipping_logs.clear()
+    planned_skips.clear()
+    duplicate_logs_skipped = 0
+    abnormal_boot_list.clear()
+    invalid_zip.clear()
+    failed_zips.clear()
+    lib_machines_count.clear()
+    lib_machines_count["all library"] = 0
+    cache_hits = 0
+    date_index_skips = 0
+
 def parse_log_line(line):
     """Parse a local log line to extract timestamp and message."""
     pattern = r'(\d{2}:\d{2}:\d{2})(\.\d{3})?\s+(.*)'
@@ -56,31 +168,208 @@ def parse_log_line(line):
         }
     return None
 
+def parse_log_time(line):
+    """Fast path of parse_log_line: seconds since midnight of the HH:MM:SS(.fff) prefix, or None for the same lines
+    parse_log_line rejects. Uses fixed offsets instead of a regex + strptime."""
+    if line[:1].isspace():
+        line = line.lstrip()
+    if line[2:3] != ':' or line[5:6] != ':':
+        return None
+    hours, minutes, seconds = line[0:2], line[3:5], line[6:8]
+    if not (hours.isdecimal() and minutes.isdecimal() and seconds.isdecimal()):
+        return None
+    rest = line[8:]
+    if rest[:1] == '.' and rest[1:4].isdecimal() and len(rest[1:4]) == 3:    #optional milliseconds
+        rest = rest[4:]
+    if not rest[:1].isspace() or not rest.strip():  #needs whitespace and then a message
+        return None
+    hours, minutes, seconds = int(hours), int(minutes), int(seconds)
+    if hours > 23 or minutes > 59 or seconds > 59:
+        return None
+    return hours*3600 + minutes*60 + seconds
+
+def seconds_to_time(seconds):
+    return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+class EventStore:
+    """Classified events kept column by column instead of one dict per row: Library, Machine and Error Type as
+    codes into a list of names, Date as a day number (date.toordinal()) and Time as seconds since midnight.
+    The Message is not there, it is never exported."""
+    text_columns = ('Library', 'Machine', 'Error Type')
+
+    def __init__(self):
+        self.categories = {column: [] for column in self.text_columns}
+        self.category_codes = {column: {} for column in self.text_columns}
+        self.columns = {column: array('i') for column in self.text_columns + ('Date', 'Time')}
+        self.day_numbers = {}
+        self.dates = {}
+
+    def code(self, column, value):
+        codes = self.category_codes[column]
+        if value not in codes:
+            codes[value] = len(self.categories[column])
+            self.categories[column].append(value)
+        return codes[value]
+
+    def day_number(self, date_str):
+        if date_str not in self.day_numbers:
+            day = datetime.date.fromisoformat(date_str).toordinal()
+            self.day_numbers[date_str] = day
+            self.dates[day] = date_str
+        return self.day_numbers[date_str]
+
+    def append(self, parsed):
+        """Add one row (a parsed dict with Time in seconds since midnight)."""
+        for column in self.text_columns:
+            self.columns[column].append(self.code(column, parsed[column]))
+        self.columns['Date'].append(self.day_number(parsed['Date']))
+        self.columns['Time'].append(parsed['Time'])
+
+    def __len__(self):
+        return len(self.columns['Time'])
+
+    def clear(self):
+        """Drop the rows, the names stay so codes remain the same."""
+        for column in self.columns:
+            self.columns[column] = array('i')
+
+    def iter_rows(self):
+        """Rows as tuples in error_cols order, with the exported text values."""
+        names = {column: self.categories[column] for column in self.text_columns}
+        values = {column: self.columns[column] for column in self.columns}
+        for i in range(len(self)):
+            yield tuple(
+                names[column][values[column][i]] if column in names
+                else self.dates[values['Date'][i]] if column == 'Date'
+                else str(seconds_to_time(values['Time'][i]))
+                for column in error_cols
+            )
+
+    def to_dataframe(self):
+        """DataFrame with categorical columns. The codes are copied once, into the smallest int type pandas keeps
+        them in (int8 for less than 127 names), so the DataFrame does not share memory with the store."""
+        import numpy as np
+        import pandas as pd
+        data = {}
+        for column in self.text_columns:
+            codes = compact_codes(np.frombuffer(self.columns[column], dtype=np.intc), len(self.categories[column]))
+            data[column] = pd.Categorical.from_codes(codes, categories=self.categories[column])
+        #few distinct days / times, so these become categories of their text
+        days, day_codes = np.unique(np.frombuffer(self.columns['Date'], dtype=np.intc), return_inverse=True)
+        data['Date'] = pd.Categorical.from_codes(compact_codes(day_codes, len(days)), categories=[self.dates[day] for day in days.tolist()])
+        seconds, second_codes = np.unique(np.frombuffer(self.columns['Time'], dtype=np.intc), return_inverse=True)
+        data['Time'] = pd.Categorical.from_codes(compact_codes(second_codes, len(seconds)), categories=[str(seconds_to_time(second)) for second in seconds.tolist()])
+        return pd.DataFrame({column: data[column] for column in error_cols})
+
+def compact_codes(codes, count):
+    """codes as the int type pandas keeps the codes of count categories in, so from_codes does not copy them again."""
+    import numpy as np
+    for dtype in (np.int8, np.int16, np.int32):
+        if count < np.iinfo(dtype).max:
+            return codes.astype(dtype)
+    return codes.astype(np.int64)
+
+all_local_error_logs = EventStore()
+
 def calc_day_sum(year, month, day):
     return year*365 + month*30 + day
 
+class DateRange:
+    """Start/end date settings parsed once per run. 'none' (or False) means no limit on that side."""
+    def __init__(self, start, end):
+        self.settings = (start, end)
+        self.start = self.parse(start)
+        self.end = self.parse(end)
+
+    @staticmethod
+    def parse(date):
+        if not date or date == 'none':
+            return None
+        #kept as yyyy-mm-dd text, which compares in date order
+        return datetime.datetime.strptime(date, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+    def __contains__(self, date_str):
+        return (self.start is None or date_str >= self.start) and (self.end is None or date_str <= self.end)
+
+    def overlaps(self, dates):
+        return any(date_str in self for date_str in dates)
+
+date_range = None
+
+def get_date_range():
+    """Return the current start/end dates as a DateRange, only parsing them again when the settings changed."""
+    global date_range
+    settings = (start_date or default_start_date, end_date or default_end_date)
+    if date_range is None or date_range.settings != settings:
+        date_range = DateRange(*settings)
+    return date_range
+
 def getJSONFILE(path):
     datafile = path
     if path == Path('error_types.json') :
-            data = default_error_types   
+            data = dict(default_error_types)
     if path == Path('settings.json'):
         data = {}
     try:
         if datafile.is_file():    
             with open(datafile, encoding='utf-8') as json_file:
                 data = json.load(json_file)
-        # UNCOMMENT TO ENABLE PRESERVING ERROR TYPES AND SETTINGS
-        if not direct_run:   
-            print(direct_run)     
+        #a missing file is written with the defaults (to keep error types and settings), reading never rewrites it
+        elif not direct_run:
             with open(datafile, 'w') as json_file:
                 json.dump(data, json_file, indent=4)
     except json.JSONDecodeError as e:
         print(f"JSONDecodeError: {e}. Initializing with default data.")
-        data = default_error_types
+        data = dict(default_error_types)
         # with open(datafile, 'w') as json_file:
         #         json.dump(data, json_file, indent=4)
     return data
 
+def read_json_file(path, default):
+    """Contents of a json file, or default when it is missing or broken. Never writes."""
+    try:
+        with open(path, encoding='utf-8') as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        return default
+    except json.JSONDecodeError as e:
+        print(f"JSONDecodeError: {e}. Using the default data.")
+        return default
+
+#everything a batch run needs, read once (load_config); error_types is a tuple of (name, pattern) like ErrorMatcher.error_types,
+#rule_sets the rule sets they come from
+RunConfig = collections.namedtuple('RunConfig', ['folder', 'output', 'start_date', 'end_date', 'error_types', 'rule_sets'])
+run_config = None   #RunConfig of the analyze() call running, settings and error types then come from it only
+
+def load_config(folder=None, output=None, start=None, end=None, error_types=None, rule_sets=None):
+    """RunConfig snapshot: the arguments given, else settings.json / the --rules files / error_types.json, else the
+    defaults. start / end are yyyy-mm-dd, a date or 'none'; error_types is {name: pattern}, rule_sets a list of rule
+    sets (see read_rule_set). The json files are only read when something is missing, and never written."""
+    settings = {}
+    if folder is None or output is None or start is None or end is None:
+        settings = read_json_file('settings.json', {})
+    if rule_sets is None and error_types is None and rule_set_paths:
+        rule_sets = [read_rule_set(path) for path in rule_set_paths]
+    if rule_sets is None:
+        if error_types is None:
+            error_types = read_json_file('error_types.json', default_error_types)
+        rule_sets = [rule_set_of_error_types(error_types)]
+    if output is None:
+        output = settings.get('output_excel_location', output_excel_location)
+    dates = []
+    for value, key, default in ((start, 'start_date', default_start_date), (end, 'end_date', default_end_date)):
+        if value is None:
+            value = settings.get(key) or default
+        dates.append(value.isoformat() if isinstance(value, datetime.date) else value)
+    return RunConfig(
+        folder=folder if folder is not None else settings.get('folderpath', folderpath),
+        output=re.sub('<date>', today.strftime('%d-%m-%Y'), output),
+        start_date=dates[0],
+        end_date=dates[1],
+        error_types=ErrorMatcher(rule_sets=rule_sets).error_types,
+        rule_sets=rule_sets
+    )
+
 def get_settings_json():
     path = Path('settings.json')
     return getJSONFILE(path)
@@ -127,84 +416,495 @@ def remove_error_json(key):
     else:
         return False
         
-def get_error_type(message, parsed):
-    global normal_boot_indicator_time
-    error_types = get_error_json()
-    """Determine the error type based on the message content."""
-    for error in error_types:
-        if re.search(error_types[error], message):
-            # print(error + '\n')
-            if error == "language_change" or error == "logout(timeout)" or error == "logout(user)":
-                normal_boot_indicator_time = parsed["Time"]
-                
-                return error
-            if error == "boot":
-                if normal_boot_indicator_time:  #case: last indicator exist
-                    if normal_boot_indicator_time == "FAKE":
-                        return "Abnormal boot"
-                    time_diff = parsed["Time"] - normal_boot_indicator_time
-                    if time_diff.total_seconds() > 3*60:    #case: last indicator exists and is > 3 min earlier
-                        
-                        return "Abnormal boot"
-                    else:   #case: last indicator exist and is within 3 min = normal boot
-                        return "Normal boot" 
-                else:   #case: last indicator dont exist, but is booting
-                    normal_boot_indicator_time = "FAKE"
-                    return "First boot"
-            
-            return error
-    return False
+def pattern_literal(pattern):
+    """The text a pattern matches if it is a plain literal (escaped punctuation allowed), else None."""
+    text = []
+    escaped = False
+    for char in pattern:
+        if escaped:
+            if char.isalnum():  #\d, \s, \b, \1... are not literals
+                return None
+            text.append(char)
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in '.^$*+?{}[]|()':
+            return None
+        else:
+            text.append(char)
+    if escaped or not text:
+        return None
+    return ''.join(text)
+
+#--------------------------------rule sets------------------------------
+rule_roles = ('boot', 'normal_shutdown', 'remote_restart')
+#roles of the error types of error_types.json (which has none of its own): a boot within 3 min after a normal shutdown
+#is a normal boot, an abnormal boot followed by a remote restart the same day too
+default_roles = {
+    'boot': 'boot',
+    'language_change': 'normal_shutdown',
+    'logout(timeout)': 'normal_shutdown',
+    'logout(user)': 'normal_shutdown',
+    'logout(remote)': 'remote_restart'
+}
+rule_keys = ('name', 'pattern', 'literal', 'priority', 'role')
+rules_format = 1    #bump when the compiled rule sets change shape
+
+def rule_set_of_error_types(error_types, name='default'):
+    """Rule set of a {name: regex} dict (error_types.json): all of the same priority, so config order decides."""
+    return {'name': name, 'rules': [{'name': error, 'pattern': pattern, 'role': default_roles.get(error)} for error, pattern in error_types.items()]}
+
+def read_rule_set(path):
+    """Rule set of a json file: {"name", "version", "rules": [{"name", "pattern", "literal", "priority", "role"}]},
+    or a {name: regex} file like error_types.json, named after the file."""
+    try:
+        with open(path, encoding='utf-8') as json_file:
+            data = json.load(json_file)
+    except json.JSONDecodeError as e:
+        raise ValueError(f'{path} is not valid json ({e})')
+    if isinstance(data, dict) and 'rules' not in data and all(isinstance(pattern, str) for pattern in data.values()):
+        return rule_set_of_error_types(data, Path(path).stem)
+    return data
+
+def validate_rule_set(rule_set, primary=True):
+    """Checked copy of a rule set with every key filled in, rules sorted by priority (highest first, file order
+    between equal ones). Raises ValueError listing every problem found. Roles are only allowed in the primary set."""
+    if not isinstance(rule_set, dict):
+        raise ValueError('a rule set is a json object with a "name" and "rules"')
+    problems = []
+    name = rule_set.get('name')
+    if not isinstance(name, str) or not name.strip() or '/' in name:
+        problems.append('the rule set needs a "name" (text without /)')
+        name = str(name)
+    rules = rule_set.get('rules')
+    if not isinstance(rules, list):
+        problems.append('"rules" must be a list')
+        rules = []
+    checked = []
+    names = set()
+    for number, rule in enumerate(rules, 1):
+        if not isinstance(rule, dict):
+            problems.append(f'rule {number} is not an object')
+            continue
+        label = f'rule {number} ({rule.get("name")})'
+        for key in rule:
+            if key not in rule_keys:
+                problems.append(f'{label}: unknown key "{key}"')
+        rule_name, pattern = rule.get('name'), rule.get('pattern')
+        literal, priority, role = rule.get('literal', False), rule.get('priority', 0), rule.get('role')
+        if not isinstance(rule_name, str) or not rule_name.strip():
+            problems.append(f'{label}: needs a "name"')
+        elif rule_name in names:
+            problems.append(f'{label}: name used twice')
+        names.add(rule_name)
+        if not isinstance(literal, bool):
+            problems.append(f'{label}: "literal" must be true or false')
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            problems.append(f'{label}: "priority" must be a whole number')
+            priority = 0
+        if role is not None and role not in rule_roles:
+            problems.append(f'{label}: role must be one of {", ".join(rule_roles)}')
+        elif role is not None and not primary:
+            problems.append(f'{label}: roles are only read from the first rule set')
+        if not isinstance(pattern, str) or not pattern:
+            problems.append(f'{label}: needs a non empty "pattern"')
+        elif literal is not True:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                problems.append(f'{label}: pattern is not a valid regex ({e})')
+        checked.append({'name': rule_name, 'pattern': pattern, 'literal': literal, 'priority': priority, 'role': role})
+    if problems:
+        raise ValueError(f'rule set {name}: ' + '; '.join(problems))
+    checked.sort(key=lambda rule: -rule['priority'])
+    return {'name': name, 'version': rule_set.get('version'), 'rules': checked}
+
+def rule_sets_key(rule_sets):
+    """Content hash of rule sets (as given, before validation)."""
+    return hashlib.sha1(json.dumps([rules_format, rule_sets], sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def combined_regexes(rules):
+    """(any regex, ordered regex) sources of rules ({'regex'}), or (None, None) when they cannot be combined."""
+    if not rules:
+        return None, None
+    try:
+        #backreferences inside a pattern would point at the wrong group once combined, keep those on the slow path
+        if any(re.compile(rule['regex']).groups for rule in rules):
+            return None, None
+        #cheap reject: one scan tells if ANY error type is in the line (most lines have none)
+        any_regex = '|'.join(f'(?:{rule["regex"]})' for rule in rules)
+        #which one: every error type is a lookahead from position 0, tried in priority order = first match wins
+        ordered_regex = '|'.join(f'(?=[\\s\\S]*?(?P<e{i}>{rule["regex"]}))' for i, rule in enumerate(rules))
+        re.compile(any_regex)
+        re.compile(ordered_regex)
+    except re.error:
+        return None, None
+    return any_regex, ordered_regex
+
+def compile_rule_sets(rule_sets):
+    """Everything ErrorMatcher is built from: output names, regexes and roles of the rules of every set, the combined
+    regexes and the literals of the byte prefilter. Kept in rules_cache_location by content hash, so rule sets seen
+    before are not validated or worked out again (the combined regexes still get compiled by re when loaded)."""
+    key = rule_sets_key(rule_sets)
+    path = os.path.join(rules_cache_location, key + '.json')
+    compiled = read_json_file(path, None)
+    if compiled is not None and compiled.get('format') == rules_format:
+        return compiled
+    sets = [validate_rule_set(rule_set, primary=(i == 0)) for i, rule_set in enumerate(rule_sets)]
+    set_names = [rule_set['name'] for rule_set in sets]
+    if len(set(set_names)) != len(set_names):
+        raise ValueError(f'rule set names used twice: {", ".join(sorted({name for name in set_names if set_names.count(name) > 1}))}')
+    compiled_sets = []
+    literals = []
+    for i, rule_set in enumerate(sets):
+        rules = []
+        for rule in rule_set['rules']:
+            #rules of the first set keep their own name in the output, the others get the set name in front
+            rules.append({
+                'name': rule['name'] if i == 0 else f'{rule_set["name"]}/{rule["name"]}',
+                'regex': re.escape(rule['pattern']) if rule['literal'] else rule['pattern'],
+                'role': rule['role']
+            })
+            literals.append(rule['pattern'] if rule['literal'] else pattern_literal(rule['pattern']))
+        any_regex, ordered_regex = combined_regexes(rules)
+        compiled_sets.append({'name': rule_set['name'], 'version': rule_set['version'], 'rules': rules, 'ordered_regex': ordered_regex})
+    every_rule = [rule for rule_set in compiled_sets for rule in rule_set['rules']]
+    compiled = {
+        'format': rules_format,
+        'hash': key,
+        'rule_sets': compiled_sets,
+        'any_regex': combined_regexes(every_rule)[0] if all(rule_set['ordered_regex'] for rule_set in compiled_sets) else None,
+        'literals': literals if literals and None not in literals else None
+    }
+    try:
+        os.makedirs(rules_cache_location, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as json_file:
+            json.dump(compiled, json_file, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass    #read-only folder: compiled again next time
+    return compiled
+
+class ErrorMatcher:
+    """Rule sets (or the error types of error_types.json) compiled once per run, classifying a line with a single
+    regex scan. When every error type is a literal (the default ones are), byte_literals lets the raw log bytes be
+    searched before anything is decoded."""
+    def __init__(self, error_types=None, mtime=None, rule_sets=None):
+        if rule_sets is None:
+            rule_sets = [rule_set_of_error_types(error_types)]
+        compiled = compile_rule_sets(rule_sets)
+        self.rule_sets = rule_sets  #as given, for the worker processes and the shard partials
+        self.hash = compiled['hash']
+        self.mtime = mtime
+        self.set_names = tuple(rule_set['name'] for rule_set in compiled['rule_sets'])
+        self.error_types = tuple((rule['name'], rule['regex']) for rule_set in compiled['rule_sets'] for rule in rule_set['rules'])
+        primary_rules = compiled['rule_sets'][0]['rules'] if compiled['rule_sets'] else []
+        self.boot_types = tuple(rule['name'] for rule in primary_rules if rule['role'] == 'boot')
+        self.normal_shutdown_types = tuple(rule['name'] for rule in primary_rules if rule['role'] == 'normal_shutdown')
+        self.remote_restart_types = tuple(rule['name'] for rule in primary_rules if rule['role'] == 'remote_restart')
+        self.literals = tuple(compiled['literals']) if compiled['literals'] is not None else None
+        self.encoded_literals = {}  #encoding -> byte_literals
+        self.any_regex = re.compile(compiled['any_regex']) if compiled['any_regex'] else None
+        #(names, ordered regex) of every set, or (names, patterns) for a set that could not be combined
+        self.sets = []
+        for rule_set in compiled['rule_sets']:
+            names = tuple(rule['name'] for rule in rule_set['rules'])
+            if rule_set['ordered_regex']:
+                self.sets.append((names, re.compile(rule_set['ordered_regex']), None))
+            else:
+                self.sets.append((names, None, tuple(re.compile(rule['regex']) for rule in rule_set['rules'])))
+
+    def byte_literals(self, encoding):
+        """The literal error types as bytes of the encoding (duplicates removed), None when an error type is a regex
+        or cannot be written in the encoding."""
+        if encoding not in self.encoded_literals:
+            try:
+                self.encoded_literals[encoding] = tuple({literal.encode(encoding): None for literal in self.literals}) if self.literals else None
+            except UnicodeEncodeError:
+                self.encoded_literals[encoding] = None
+        return self.encoded_literals[encoding]
 
-def process_log_file(filepath, date_str, library, machine):
-    """Read a log file and extract error-related data."""
+    def match_set(self, index, line):
+        """The first error type (in priority order) of one rule set found in the line, or False."""
+        names, ordered_regex, patterns = self.sets[index]
+        if ordered_regex is None:
+            for error, pattern in zip(names, patterns):
+                if pattern.search(line):
+                    return error
+            return False
+        match = ordered_regex.match(line)
+        return names[int(match.lastgroup[1:])] if match else False
+
+    def match(self, line):
+        """Return the first error type (in priority order) of the first rule set found in the line, or False."""
+        if not self.sets or (self.any_regex is not None and not self.any_regex.search(line)):
+            return False
+        return self.match_set(0, line)
+
+    def match_all(self, line):
+        """The error type found in the line for every rule set (at most one per set, in rule set order)."""
+        if self.any_regex is not None and not self.any_regex.search(line):
+            return []
+        return [error for error in (self.match_set(i, line) for i in range(len(self.sets))) if error]
+
+def print_rule_sets(matcher):
+    """The error types of every rule set, in the order they are tried, with their role."""
+    roles = {}
+    for role in rule_roles:
+        for error in getattr(matcher, role + '_types'):
+            roles[error] = role
+    names = iter(matcher.error_types)
+    for set_name, (set_errors, _, _) in zip(matcher.set_names, matcher.sets):
+        print('\033[95m' + f'{set_name}: {len(set_errors)} error types' + '\033[0m')
+        for _ in set_errors:
+            error, regex = next(names)
+            print('\033[94m' + f'\t{error}: {regex}' + (f' ({roles[error]})' if error in roles else '') + '\033[0m')
+    print('\033[92m' + f'rule sets ok ({matcher.hash[:12]})' + '\033[0m')
+
+error_matcher = None
+
+def rule_file_mtimes():
+    """mtimes of the files the rule sets come from (None for a missing file)."""
+    paths = rule_set_paths or ['error_types.json']
+    return tuple(os.stat(path).st_mtime_ns if os.path.isfile(path) else None for path in paths)
+
+def read_rule_sets():
+    """Rule sets of the --rules files, else the one of error_types.json."""
+    if rule_set_paths:
+        return [read_rule_set(path) for path in rule_set_paths]
+    return [rule_set_of_error_types(get_error_json())]
+
+def get_error_matcher():
+    """Return the compiled rule sets, only reading error_types.json / the rule set files again when one of them
+    changed (a follow run picks up edited rules this way)."""
+    global error_matcher
+    if run_config is not None and error_matcher is not None:
+        return error_matcher
+    if error_matcher is None or error_matcher.mtime != rule_file_mtimes():
+        rule_sets = read_rule_sets()
+        #get_error_json may write the file back, so take the mtimes after reading
+        error_matcher = ErrorMatcher(rule_sets=rule_sets, mtime=rule_file_mtimes())
+    return error_matcher
+
+def get_error_type(message):
+    """Determine the error type based on the message content (boots are only labelled later by classify_boots)."""
+    matcher = error_matcher or get_error_matcher()
+    return matcher.match(message)
+
+def classify_boots(data, state=(None, False)):
+    """Label the boot rows (role boot) of one log file (rows in line order, Time in seconds since midnight):
+    - no normal logout before it: "First boot" for the first boot of the file, "Abnormal boot" for the next ones
+    - last normal logout (role normal_shutdown) more than 3 min before: "Abnormal boot", else "Normal boot"
+    The last normal logout of every boot is found by bisecting the positions of the normal logouts.
+    state is (last normal logout time or None, booted already) of the lines before data, so a file can be
+    classified in pieces; the state after data is returned."""
+    last_indicator, booted = state
+    matcher = error_matcher or get_error_matcher()
+    boots = [i for i, parsed in enumerate(data) if parsed['Error Type'] in matcher.boot_types]
+    indicators = [i for i, parsed in enumerate(data) if parsed['Error Type'] in matcher.normal_shutdown_types]
+    times = [parsed['Time'] for parsed in data]
+    if boots:
+        #the state is a normal logout sitting just before the first line
+        indicator_positions = ([-1] if last_indicator is not None else []) + indicators
+        indicator_times = ([last_indicator] if last_indicator is not None else []) + [times[i] for i in indicators]
+        for n, i in enumerate(boots):
+            previous = bisect.bisect_left(indicator_positions, i) - 1
+            if previous < 0:     #case: last indicator dont exist, only the very first boot is a first boot
+                data[i]['Error Type'] = "Abnormal boot" if booted or n > 0 else "First boot"
+            elif times[i] - indicator_times[previous] > 3*60:    #case: last indicator exists and is > 3 min earlier
+                data[i]['Error Type'] = "Abnormal boot"
+            else:   #case: last indicator exist and is within 3 min = normal boot
+                data[i]['Error Type'] = "Normal boot"
+    if indicators:
+        last_indicator = times[indicators[-1]]
+    return last_indicator, booted or bool(boots)
+
+def process_log_stream(binary, date_str, library, machine, counters=None):
+    """process_log_lines for a log file opened in binary mode (see match_log_stream)."""
+    data = match_log_stream(binary, date_str, library, machine, counters)
+    classify_boots(data)
+    return data
+
+def process_log_lines(lines, date_str, library, machine):
+    """Extract error-related data from the lines of one log file (a file object or any iterable of lines)."""
+    data = match_log_lines(lines, date_str, library, machine)
+    classify_boots(data)
+    return data
+
+def match_log_lines(lines, date_str, library, machine):
+    """Rows of the lines with an error type, boots not labelled yet (see classify_boots). The message of the line is
+    not kept: it is never exported, and the rows of a zip are pickled from the workers and stored in the cache."""
     data = []
-    global normal_boot_indicator_time
-    normal_boot_indicator_time = False  #reset the time indicator
-    # error_types = get_error_json() 
-    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-        for line in f:
-            parsed = parse_log_line(line)  # Use single parsing function
-            # if re.match(error_types["logout(user)"], line):
-            #     print(line)
-               
-            if parsed:
-                time = datetime.datetime.strptime(parsed['Time'], '%H:%M:%S')   #USING TIME OBJECT for get error type
-                parsed.update({"Time": time})
-                error_type = get_error_type(line, parsed)  
-                if error_type:
-                    
-                    parsed['Error Type'] = error_type
-                    parsed['Date'] = date_str
-                    parsed['Library'] = library
-                    parsed['Machine'] = machine
-                    if error_type == 'Abnormal boot':
-                        if machine in abnormal_boot_list:
-                            if date_str not in abnormal_boot_list[machine]:
-                                abnormal_boot_list[machine][date_str] = [parsed]
-                            else:
-                                abnormal_boot_list[machine][date_str].append(parsed)
-                        else:
-                            abnormal_boot_list[machine] = {}
-                            abnormal_boot_list[machine][date_str] = [parsed]
-                        continue
-                    if error_type == 'logout(remote)':
-                        if machine in abnormal_boot_list:
-                            if date_str in abnormal_boot_list[machine]:
-                                for abnormal_boot in abnormal_boot_list[machine][date_str]:
-                                    # print(abnormal_boot)
-                                    time_diff = abnormal_boot['Time'] - time
-                                    if time_diff.total_seconds() <= 3*60:
-                                        
-                                        abnormal_boot.update({"Error Type": "Normal boot"})
-                                        abnormal_boot.update({"Time": time.time()})
-                                        data.append(abnormal_boot)
-                                        abnormal_boot_list[machine][date_str].remove(abnormal_boot)
-                                    else:
-                                        continue
-                    parsed.update({"Time": time.time()})
-                    data.append(parsed)
-                    
+    matcher = error_matcher or get_error_matcher()
+    #one rule set: its first error type in the line, several: a row for every rule set with one
+    match_error = matcher.match if len(matcher.sets) < 2 else matcher.match_all
+    for line in lines:
+        #cheap reject first: almost no line has an error type, only the rest gets its time parsed
+        error = match_error(line)
+        if not error:
+            continue
+        time = parse_log_time(line)
+        if time is not None:
+            for error_type in ((error,) if isinstance(error, str) else error):
+                data.append({
+                    'Time': time,
+                    'Error Type': error_type,
+                    'Date': date_str,
+                    'Library': library,
+                    'Machine': machine
+                })
+    return data
+
+log_block_size = 4*1024*1024    #bytes read at once by match_log_stream
+log_boms = ((codecs.BOM_UTF8, 'utf-8'), (b'\x84\x31\x95\x33', 'gb18030'))
+
+def new_log_counters():
+    """What match_log_stream counts for the metrics of a log file."""
+    return {'lines': 0, 'undecodable_bytes': 0, 'encoding': None}
+
+def log_bom(head):
+    """(encoding, length) of the BOM the log file starts with, else (None, 0)."""
+    for bom, encoding in log_boms:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    return None, 0
+
+def sniff_log_encoding(buffer):
+    """Encoding of whole log lines without a BOM: the first of log_encodings they decode in, or the one dropping the
+    fewest bytes when none does. None while they are plain ascii (every encoding reads them the same)."""
+    if buffer.isascii():
+        return None
+    for encoding in log_encodings:
+        if is_decodable(buffer, encoding):
+            return encoding
+    return min(log_encodings, key=lambda encoding: len(buffer) - len(buffer.decode(encoding, errors='ignore').encode(encoding)))
+
+def match_log_stream(binary, date_str, library, machine, counters=None):
+    """match_log_lines for a log file opened in binary mode, read in blocks of whole lines (match_log_buffer). The
+    encoding is found once per file: its BOM, else sniffed on the first block that is not plain ascii.
+    counters (new_log_counters) gets the lines, undecodable bytes and encoding of the file, for the metrics."""
+    data = []
+    rest = b''
+    encoding = None
+    first = True
+    while True:
+        block = binary.read(log_block_size)
+        if not block:
+            break
+        if first:
+            encoding, skip = log_bom(block)
+            block = block[skip:]
+            first = False
+        if rest:
+            block = rest + block
+        end = block.rfind(b'\n') + 1
+        rest = block[end:]
+        if end:
+            lines = block[:end] if rest else block
+            encoding = encoding or sniff_log_encoding(lines)
+            data.extend(match_log_buffer(lines, date_str, library, machine, encoding or 'utf-8', counters))
+    if rest:
+        encoding = encoding or sniff_log_encoding(rest)
+        data.extend(match_log_buffer(rest, date_str, library, machine, encoding or 'utf-8', counters))
+    if counters is not None:
+        counters['encoding'] = encoding or 'ascii'
     return data
+
+def is_decodable(buffer, encoding):
+    if buffer.isascii():    #ascii reads the same in all the log encodings
+        return True
+    try:
+        buffer.decode(encoding)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def match_log_buffer(buffer, date_str, library, machine, encoding='utf-8', counters=None):
+    """match_log_lines for the bytes of whole lines in the encoding. With only literal error types the buffer is
+    searched for each of them in that encoding (bytes.find, no decoding, no regex) and only the lines holding one are
+    decoded; almost no line does. Else, or when the buffer does not decode (decoding drops the bad bytes, which could
+    join the two halves of an error type), the whole buffer is decoded and its undecodable bytes are counted.
+    Both split lines like reading the file as text (universal newlines); no byte of a line break is ever part of a
+    utf-8 or gb18030 character."""
+    if counters is not None:
+        counters['lines'] += buffer.count(b'\n') + (buffer[-1:] not in (b'', b'\n'))
+    literals = (error_matcher or get_error_matcher()).byte_literals(encoding)
+    if literals is None or not is_decodable(buffer, encoding):
+        text = buffer.decode(encoding, errors='ignore')
+        if counters is not None:
+            counters['undecodable_bytes'] += len(buffer) - len(text.encode(encoding))
+        return match_log_lines(io.StringIO(text, newline=None), date_str, library, machine)
+    lines = {}  #start -> end of the lines holding a literal
+    for literal in literals:
+        position = buffer.find(literal)
+        while position != -1:
+            start = buffer.rfind(b'\n', 0, position) + 1
+            end = buffer.find(b'\n', position) + 1 or len(buffer)
+            lines[start] = end
+            position = buffer.find(literal, end)
+    if not lines:
+        return []
+    #a \n-line may still hold several text lines (lone \r), match_log_lines sorts them out
+    text = ''.join(buffer[start:lines[start]].decode(encoding) for start in sorted(lines))
+    return match_log_lines(io.StringIO(text, newline=None), date_str, library, machine)
+
+def add_log_data(log_data):
+    """Add classified rows to all_local_error_logs, keeping abnormal boots aside until a remote restart explains them."""
+    remote_restart_types = (error_matcher or get_error_matcher()).remote_restart_types
+    for parsed in log_data:
+        error_type = parsed['Error Type']
+        machine = parsed['Machine']
+        date_str = parsed['Date']
+        time = parsed['Time']
+        if error_type == 'Abnormal boot':
+            if machine in abnormal_boot_list:
+                if date_str not in abnormal_boot_list[machine]:
+                    abnormal_boot_list[machine][date_str] = [parsed]
+                else:
+                    abnormal_boot_list[machine][date_str].append(parsed)
+            else:
+                abnormal_boot_list[machine] = {}
+                abnormal_boot_list[machine][date_str] = [parsed]
+            continue
+        if error_type in remote_restart_types:
+            if machine in abnormal_boot_list:
+                if date_str in abnormal_boot_list[machine]:
+                    for abnormal_boot in match_remote_restart(abnormal_boot_list[machine][date_str], time):
+                        abnormal_boot.update({"Error Type": "Normal boot"})
+                        abnormal_boot.update({"Time": time})
+                        add_event(abnormal_boot)
+        add_event(parsed)
+
+def add_event(parsed):
+    """A final row (boot labels resolved) of the run: counted in the summary, kept in all_local_error_logs unless
+    only the summary is wanted."""
+    if run_history is not None:
+        run_history.add(parsed)
+    if run_summary is not None:
+        run_summary.add(parsed)
+        if not raw_rows:
+            return
+    all_local_error_logs.append(parsed)
+
+def match_remote_restart(pending, time):
+    """Take the pending abnormal boots (same machine and day) explained by a remote restart at time, i.e. the ones
+    up to 3 min after it (earlier ones included), out of the pending list and return them.
+    The old loop removed items from the list while going through it, which passes over the boot right after
+    every taken one; that is kept on purpose so the labels stay the same."""
+    taken = []
+    kept = []
+    passed_over = False
+    for abnormal_boot in pending:
+        if passed_over:
+            kept.append(abnormal_boot)
+            passed_over = False
+        elif abnormal_boot['Time'] - time <= 3*60:
+            taken.append(abnormal_boot)
+            passed_over = True
+        else:
+            kept.append(abnormal_boot)
+    pending[:] = kept
+    return taken
 # def process_local_log_file(filepath, date_str, library, machine):
 #     """Read a local log file and extract error-related data."""
 #     data = []
@@ -223,6 +923,181 @@ def process_log_file(filepath, date_str, library, machine):
 #     return data
 
 
+def new_zip_result(zip_path):
+    return {
+        'zip_path': zip_path,
+        'log_data': [],
+        'lib_machines_count': {},
+        'invalid_zip': [],
+        'dates': [],
+        'machines': [],     #[library, machine] of the machine zips, also the ones without any event
+        'logs': [],         #[name, date, CRC, size] of the log files of the zip itself (not of nested zips)
+        'nested_logs': [],  #the same for the log files of nested zips, named <nested zip>/<log file>
+        'days': [],         #[library, machine, date] of the log files inside the date range, with events or not
+        'skipped_logs': [], #log files not parsed, as an earlier zip of the run had the same one
+        'failed_logs': []   #log file the zip turned out broken in (nothing of it is in the rows)
+    }
+
+def merge_zip_result(into, result, member):
+    """Merge the result of a nested zip (member of the zip) into the zip result."""
+    into['log_data'].extend(result['log_data'])
+    for library, count in result['lib_machines_count'].items():
+        into['lib_machines_count'][library] = into['lib_machines_count'].get(library, 0) + count
+    into['invalid_zip'].extend(result['invalid_zip'])
+    into['machines'].extend(result['machines'])
+    into['days'].extend(result['days'])
+    into['dates'].extend(date for date in result['dates'] if date not in into['dates'])
+    into['nested_logs'].extend([f'{member}/{name}'] + log for name, *log in result['logs'] + result['nested_logs'])
+    into['failed_logs'].extend(f'{member}/{name}' for name in result['failed_logs'])
+    if 'metrics' in result:
+        into.setdefault('nested_metrics', []).append(result['metrics'])
+
+def walk_order(info):
+    """Sort key putting zip members in the order os.walk would visit them once extracted (files first, then subfolders)."""
+    parts = info.filename.replace('\\', '/').split('/')
+    return [(1, folder) for folder in parts[:-1]] + [(0, parts[-1])]
+
+def machine_of_zip(zip_path):
+    """Library and Machine from the zip filename (e.g., YT-GFK-PAK1.zip -> YT, YT-GFK-PAK1)."""
+    # Extract filename without extension
+    return machine_of_name(os.path.splitext(os.path.basename(zip_path))[0])
+
+def machine_of_name(machine):
+    library = machine.split('-')[0] if '-' in machine else machine
+    return library, machine
+
+def log_file_date(log_file):
+    """Date of a log file worth reading (dated .log / _local.log, not command.log), else None."""
+    # Match date in filename and skip command.log
+    date_match = re.search(date_pattern, log_file)
+    if not date_match or log_file.endswith('command.log'):
+        return None
+    # Process both _local.log and .log files
+    if not log_file.endswith(('_local.log', '.log')):
+        return None
+    return date_match.group(1)
+
+def select_log_members(zip_ref):
+    """Split the members of a zip (central directory only, nothing is read) into the dated log files of the
+    Log folder as (info, date_str) in walk order, and the other members. The log list is None when the zip
+    has no Log folder."""
+    members = sorted((info for info in zip_ref.infolist() if not info.is_dir()), key=walk_order)
+    
+    # Only look at the Log folder in the zip
+    log_members = [info for info in members if info.filename.replace('\\', '/').startswith('Log/')]
+    if not log_members:
+        return None, members
+    logs = []
+    for info in log_members:
+        date_str = log_file_date(info.filename.replace('\\', '/').split('/')[-1])
+        if date_str:
+            logs.append((info, date_str))
+    return logs, members
+
+def process_zip(zip_path, zip_file=None, skip_logs=()):
+    """Classify the logs of one machine zip straight from the archive. Only returns results, never touches
+    the run globals, so it can run in a worker process. zip_file is the zip already in memory (nested or prefetched),
+    skip_logs the names of its log files already parsed from another zip (plan_duplicate_logs)."""
+    result = new_zip_result(zip_path)
+    parsing = None
+    result['skipped_logs'] = sorted(skip_logs)
+    run_date_range = get_date_range()
+    library, machine = machine_of_zip(zip_path)
+    zip_metrics = new_zip_metrics(zip_path) if collect_metrics else None
+    
+    try:
+        with zipfile.ZipFile(zip_file or zip_path, 'r') as zip_ref:
+            logs, members = select_log_members(zip_ref)
+            if logs is None:
+                print('\033[93m' + f"Log directory not found in zip file: {zip_path}\n\tgoing thru inside of the zip file" + '\033[95m')
+                for info in members:
+                    if info.filename.endswith('.zip'):
+                        #nested zip is opened in memory instead of extracted
+                        nested_zip = io.BytesIO(zip_ref.read(info))
+                        nested_skip_logs = [name[len(info.filename) + 1:] for name in skip_logs if name.startswith(info.filename + '/')]
+                        merge_zip_result(result, process_zip(os.path.join(zip_path, info.filename), nested_zip, nested_skip_logs), info.filename)
+                if zip_metrics is not None:
+                    finish_zip_metrics(zip_metrics, result)
+                return result
+            result['lib_machines_count'][library] = 1
+            result['machines'].append([library, machine])
+            for info, date_str in logs:
+                #remember every log date of the zip (for the date index), even the skipped ones
+                if date_str not in result['dates']:
+                    result['dates'].append(date_str)
+                result['logs'].append([info.filename, date_str, info.CRC, info.file_size])
+                if date_str not in run_date_range:
+                    continue
+                if [library, machine, date_str] not in result['days']:
+                    result['days'].append([library, machine, date_str])
+                if info.filename in skip_logs:
+                    continue
+                parsing = info.filename
+                if chunk_in_memory(info.file_size):
+                    #big log file: read whole and matched in pieces by the chunk pool
+                    if zip_metrics is None:
+                        result['log_data'].extend(process_log_chunked(zip_ref.read(info), date_str, library, machine))
+                    else:
+                        result['log_data'].extend(measured_process_log_chunked(zip_metrics, info, zip_ref.read(info), date_str, library, machine))
+                    parsing = None
+                    continue
+                # read block by block out of the zip, lines are only decoded when they can hold an error type
+                with zip_ref.open(info) as f:
+                    if zip_metrics is None:
+                        result['log_data'].extend(process_log_stream(f, date_str, library, machine))
+                    else:
+                        result['log_data'].extend(measured_process_log_stream(zip_metrics, info, f, date_str, library, machine))
+                parsing = None
+                    
+    except zipfile.BadZipFile:
+        print(f'\033[91m' + f"Invalid zip file: {zip_path}" + '\033[95m')
+        result['invalid_zip'].append(zip_path)
+        if parsing is not None:
+            #a bad CRC: the log file gives no rows, its duplicate in a later zip is parsed instead (settle_duplicate_logs)
+            result['failed_logs'].append(parsing)
+    if zip_metrics is not None:
+        finish_zip_metrics(zip_metrics, result)
+    return result
+
+def add_zip_result(result):
+    """Merge a zip result into the run globals. Must be called in walk order to give the same output as a serial run."""
+    global duplicate_logs_skipped
+    for library, count in result['lib_machines_count'].items():
+        if library in lib_machines_count:  
+            lib_machines_count[library] += count
+        else:
+            lib_machines_count[library] = count
+        lib_machines_count['all library'] += count
+    invalid_zip.extend(result['invalid_zip'])
+    if 'failed' in result:
+        failed_zips.append(result['failed'])
+    duplicate_logs_skipped += len(result['skipped_logs'])
+    if run_summary is not None:
+        run_summary.add_machines(result['machines'])
+    if run_history is not None:
+        run_history.add_days(result['days'])
+    if run_metrics is not None:
+        add_zip_metrics(result)
+    if shard_partial is not None:
+        #boots are matched by --merge, with the zips of the other shards
+        shard_partial.add(result)
+        return
+    with timed_stage('boot_matching'):
+        add_log_data(result['log_data'])
+    if output_stream is not None:
+        with timed_stage('excel_write'):
+            output_stream.write_rows(all_local_error_logs.iter_rows())
+        all_local_error_logs.clear()
+
+def find_zip_files(logs_folder):
+    """List every zip under logs_folder, in the same order recursive_walk_for_zip visits them."""
+    zip_paths = []
+    for root, _folder, files in os.walk(logs_folder):
+        for file in files:
+            if file.endswith('.zip') and file != '.gitignore':
+                zip_paths.append(os.path.join(root, file))
+    return zip_paths
+
 def recursive_walk_for_zip(logs_folder, log_filetype):
     for root, _folder, files in os.walk(logs_folder):
         print('\033[95m' + f'going through: {root}: {_folder} ' + '\033[0m')
@@ -235,75 +1110,8 @@ def recursive_walk_for_zip(logs_folder, log_filetype):
                 print('machine progress%: ', end=" ")
             if file.endswith('.zip') and file != '.gitignore':
                 zip_path = os.path.join(root, file)
-                
-                # Extract filename without extension
-                filename = os.path.splitext(file)[0]
-                
-                # Extract Library and Machine from filename (e.g., YT-GFK-PAK1)
-                library = filename.split('-')[0] if '-' in filename else filename
-                machine = filename
-                
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    try:
-                        # Extract zip file
-                        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                            zip_ref.extractall(temp_dir)
-                        
-                        # Walk through the Log folder in the zip
-                        log_dir = os.path.join(temp_dir, 'Log')
-                        if not os.path.exists(log_dir):
-                            print('\033[93m' + f"Log directory not found in zip file: {zip_path}\n\tgoing thru inside of the zip file" + '\033[95m')
-                            recursive_walk_for_zip(temp_dir, log_filetype)
-                            continue
-                        if library in lib_machines_count:  
-                            lib_machines_count[library] += 1
-                        else:
-                            lib_machines_count[library] = 1
-                        lib_machines_count['all library'] += 1        
-                        for log_root, _, log_files in os.walk(log_dir):
-                            for log_file in log_files:
-                                # Match date in filename and skip command.log
-                                date_match = re.search(date_pattern, log_file)
-                                if not date_match or log_file.endswith('command.log'):
-                                    continue
-                                
-                                date_str = date_match.group(1)
-                                
-                                global start_date
-                                global default_start_date
-                                global end_date
-                                global default_end_date
-                                
-                                new_date_str=datetime.datetime.strptime(date_str, '%Y-%m-%d')
-                                
-                                #check if have a default start date
-                                if not start_date:
-                                    start_date = default_start_date
-                                #if both is false then no need do skipping
-                                if start_date and not start_date  == "none":
-                                    if( new_date_str < datetime.datetime.strptime(start_date, '%Y-%m-%d')):
-                                        continue
-                                
-                                #check if have a default end date
-                                if not end_date:
-                                    end_date = default_end_date
-                                #same same
-                                if end_date and not end_date == "none":
-                                    if( new_date_str > datetime.datetime.strptime(end_date, '%Y-%m-%d')):
-                                        continue
-                                
-                                filepath = os.path.join(log_root, log_file)
-                                
-                                # Process both _local.log and .log files
-                                if log_file.endswith(('_local.log', '.log')):
-                                    log_data = process_log_file(filepath, date_str, library, machine)
-                                    all_local_error_logs.extend(log_data)
-                                
-                                    
-                    except zipfile.BadZipFile:
-                        print(f'\033[91m' + f"Invalid zip file: {zip_path}" + '\033[95m')
-                        invalid_zip.append(zip_path)
-                        continue
+                if in_shard(zip_path):
+                    add_zip_result(cached_process_zip(zip_path))
             file_count += 1
             progress = file_count / len(files) * 100
             
@@ -315,46 +1123,1771 @@ def recursive_walk_for_zip(logs_folder, log_filetype):
         # print('num of library left:', end=' ')
         # print(len(next(os.walk(logs_folder))[1]) - len(lib_machines_count) + 1)             
         print('\033[0m')
-    # with open('invalid_zip.txt', 'w') as f:
-    #     count = 0
-    #     for zip in invalid_zip:
-    #         f.write(zip + '\n')
-    #         count += 1
-    #     print('\033[92m' + f"invalid_zip.txt created, total invalid zips: {count}")
 
+#--------------------------------zip cache------------------------------
+zip_cache = None
+zip_cache_config = None
+cache_format = 8    #bump when the stored rows change shape (2: Time in seconds since midnight, 3: machine names, 4: log files, 5: machine days, 6: log encodings, 7: nested and failed log files, 8: no Message)
 
-def extract_errors_to_single_excel(logs_folder='logs', output_excel='xlsx/error_logs.xlsx', log_filetype = 'local'):
-    """Extract specified error types from local logs in all zip files across subfolders and save to a single Excel file."""
-    
-    recursive_walk_for_zip(logs_folder, log_filetype)
-    # print(all_local_error_logs)
-    # Create DataFrame
+def get_cache_config_hash():
+    """Hash of everything that changes the rows of a zip besides the zip itself (rule sets, date range and the
+    encodings log files are read in)."""
+    config = [cache_format, get_error_matcher().hash, start_date or default_start_date, end_date or default_end_date, list(log_encodings)]
+    return hashlib.sha1(json.dumps(config, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def open_zip_cache():
+    global zip_cache
+    global zip_cache_config
+    if not use_cache:
+        return None
+    os.makedirs(os.path.dirname(cache_location), exist_ok=True)
+    zip_cache = sqlite3.connect(cache_location)
+    zip_cache.execute('CREATE TABLE IF NOT EXISTS zip_cache (zip_path TEXT, config_hash TEXT, size INTEGER, mtime INTEGER, '
+                      'result TEXT, last_used REAL, PRIMARY KEY (zip_path, config_hash))')
+    if rebuild_cache:
+        zip_cache.execute('DELETE FROM zip_cache')
+        zip_cache.commit()
+    zip_cache_config = get_cache_config_hash()
+    load_date_index()
+    return zip_cache
+
+def close_zip_cache():
+    """Evict old / least recently used zips and close the cache."""
+    global zip_cache
+    save_date_index()
+    if zip_cache is None:
+        return
+    zip_cache.execute('DELETE FROM zip_cache WHERE last_used < ?', (time_module.time() - cache_max_age_days*24*60*60,))
+    zip_cache.execute('DELETE FROM zip_cache WHERE rowid NOT IN (SELECT rowid FROM zip_cache ORDER BY last_used DESC LIMIT ?)', (cache_max_entries,))
+    zip_cache.commit()
+    zip_cache.close()
+    zip_cache = None
+
+#which log dates every zip contains, so zips fully outside the date range are skipped without opening them
+date_index_location = 'cache/zip_dates.json'
+date_index = None
+date_index_skips = 0
+
+def load_date_index():
+    global date_index
+    date_index = {}
+    if rebuild_cache or not os.path.isfile(date_index_location):
+        return
+    try:
+        with open(date_index_location, encoding='utf-8') as json_file:
+            date_index = json.load(json_file)
+    except json.JSONDecodeError as e:
+        print(f"JSONDecodeError: {e}. Rebuilding the zip date index.")
+
+def save_date_index():
+    """Write the index without the zips that are gone (moved or deleted exports)."""
+    global date_index
+    if date_index is None:
+        return
+    os.makedirs(os.path.dirname(date_index_location), exist_ok=True)
+    with open(date_index_location, 'w', encoding='utf-8') as json_file:
+        json.dump({zip_path: entry for zip_path, entry in date_index.items() if os.path.isfile(zip_path)}, json_file)
+    date_index = None
+
+def index_zip_dates(zip_path, fingerprint, result):
+    """Remember the log dates of a zip. A zip that could not be opened at all is not a zip without logs in the date
+    range, so it is left out and the next run counts it as invalid again instead of as skipped."""
+    if date_index is None:
+        return
+    if result['invalid_zip'] and not result['machines'] and not result['logs'] and not result['nested_logs']:
+        date_index.pop(os.path.abspath(zip_path), None)
+        return
+    date_index[os.path.abspath(zip_path)] = {
+        'size': fingerprint[0],
+        'mtime': fingerprint[1],
+        'dates': sorted(result['dates']),
+        'lib_machines_count': result['lib_machines_count'],
+        'invalid_zip': result['invalid_zip'],
+        'machines': result['machines'],
+        'logs': result['logs'],
+        'nested_logs': result['nested_logs']
+    }
+
+def get_skipped_zip_result(zip_path, fingerprint):
+    """If the date index says the (unchanged) zip has no log inside the date range, return its empty result, else None."""
+    global date_index_skips
+    if date_index is None:
+        return None
+    entry = date_index.get(os.path.abspath(zip_path))
+    if entry is None or (entry['size'], entry['mtime']) != tuple(fingerprint) or 'nested_logs' not in entry:
+        return None
+    if get_date_range().overlaps(entry['dates']):
+        return None
+    #same machine counts as a parsed run, just no rows
+    result = new_zip_result(zip_path)
+    result['lib_machines_count'] = dict(entry['lib_machines_count'])
+    result['invalid_zip'] = list(entry['invalid_zip'])
+    result['dates'] = list(entry['dates'])
+    result['machines'] = [list(machine) for machine in entry['machines']]
+    result['logs'] = [list(log) for log in entry['logs']]
+    result['nested_logs'] = [list(log) for log in entry['nested_logs']]
+    date_index_skips += 1
+    return result
+
+def zip_fingerprint(zip_path):
+    stat = os.stat(zip_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def encode_zip_result(result):
+    return json.dumps({key: value for key, value in result.items() if key not in ('metrics', 'nested_metrics')}, ensure_ascii=False)
+
+def decode_zip_result(text):
+    return json.loads(text)
+
+def get_cached_zip_result(zip_path, fingerprint, skip_logs=()):
+    """Return the cached result of a zip if the zip (size, mtime), the config and the duplicate log files skipped
+    in it did not change, else None."""
+    global cache_hits
+    journal_result = get_journal_result(zip_path, fingerprint, skip_logs)
+    if journal_result is not None:
+        return journal_result
+    skipped_result = get_skipped_zip_result(zip_path, fingerprint)
+    if skipped_result is not None:
+        return skipped_result
+    if zip_cache is None:
+        return None
+    size, mtime = fingerprint
+    key = (os.path.abspath(zip_path), zip_cache_config)
+    row = zip_cache.execute('SELECT result FROM zip_cache WHERE zip_path = ? AND config_hash = ? AND size = ? AND mtime = ?', key + (size, mtime)).fetchone()
+    if row is None:
+        return None
+    result = decode_zip_result(row[0])
+    if result['skipped_logs'] != sorted(skip_logs):
+        return None
+    zip_cache.execute('UPDATE zip_cache SET last_used = ? WHERE zip_path = ? AND config_hash = ?', (time_module.time(),) + key)
+    cache_hits += 1
+    index_zip_dates(zip_path, fingerprint, result)
+    return result
+
+def has_stored_zip_result(zip_path, fingerprint):
+    """Whether get_cached_zip_result will likely serve the zip (journal, date index or zip cache), without loading the
+    result. It can still miss when the duplicate log files skipped in the zip changed."""
+    entry = journal_results.get(os.path.abspath(zip_path))
+    if entry is not None and entry['fingerprint'] == list(fingerprint):
+        return True
+    entry = date_index.get(os.path.abspath(zip_path)) if date_index is not None else None
+    if entry is not None and (entry['size'], entry['mtime']) == tuple(fingerprint) and 'nested_logs' in entry and not get_date_range().overlaps(entry['dates']):
+        return True
+    if zip_cache is None:
+        return False
+    size, mtime = fingerprint
+    row = zip_cache.execute('SELECT 1 FROM zip_cache WHERE zip_path = ? AND config_hash = ? AND size = ? AND mtime = ?',
+                            (os.path.abspath(zip_path), zip_cache_config, size, mtime)).fetchone()
+    return row is not None
+
+def store_zip_result(zip_path, fingerprint, result):
+    """Store a freshly processed zip, must be called before add_zip_result changes the rows. A failed zip is not
+    stored, so it is tried again by the next run."""
+    if 'failed' in result:
+        return
+    journal_zip_result(zip_path, fingerprint, result)
+    index_zip_dates(zip_path, fingerprint, result)
+    if zip_cache is None:
+        return
+    size, mtime = fingerprint
+    zip_cache.execute('INSERT OR REPLACE INTO zip_cache VALUES (?, ?, ?, ?, ?, ?)',
+                      (os.path.abspath(zip_path), zip_cache_config, size, mtime, encode_zip_result(result), time_module.time()))
+    zip_cache.commit()
+
+def cached_process_zip(zip_path):
+    """process_zip, but served from the cache when the zip did not change since the last run."""
+    fingerprint = zip_fingerprint(zip_path)
+    skip_logs = plan_duplicate_logs(zip_path, fingerprint)
+    result = get_cached_zip_result(zip_path, fingerprint, skip_logs)
+    if result is None:
+        result = run_zip(zip_path, skip_logs=skip_logs)
+        store_zip_result(zip_path, fingerprint, result)
+    return settle_duplicate_logs(zip_path, fingerprint, skip_logs, result)
+
+def read_zip_directory(zip_path, zip_file=None):
+    """select_log_members of a zip (zip_file when it is already in memory), from its central directory only.
+    A zip that cannot be read has no members, it fails when it is processed."""
+    try:
+        with zipfile.ZipFile(zip_file if zip_file is not None else zip_path, 'r') as zip_ref:
+            return select_log_members(zip_ref)
+    except (zipfile.BadZipFile, OSError):
+        return None, []
+
+def indexed_zip_logs(zip_path, fingerprint):
+    """[name, date, CRC, size] of the log files of a zip and of its nested zips from the date index, None when the
+    zip is not in it or changed."""
+    entry = date_index.get(os.path.abspath(zip_path)) if date_index is not None else None
+    if entry is not None and (entry['size'], entry['mtime']) == tuple(fingerprint) and 'nested_logs' in entry:
+        return entry['logs'] + entry['nested_logs']
+    return None
+
+def list_zip_logs(zip_ref):
+    """[name, date, CRC, size] of the log files of an open zip, or of its nested zips (named <nested zip>/<log file>)
+    when it has no Log folder. Nested zips are read in memory for their central directory."""
+    logs, members = select_log_members(zip_ref)
+    if logs is not None:
+        return [[info.filename, date_str, info.CRC, info.file_size] for info, date_str in logs]
+    nested_logs = []
+    for info in members:
+        if info.filename.endswith('.zip'):
+            try:
+                with zipfile.ZipFile(io.BytesIO(zip_ref.read(info)), 'r') as nested_ref:
+                    nested_logs.extend([f'{info.filename}/{name}'] + log for name, *log in list_zip_logs(nested_ref))
+            except zipfile.BadZipFile:
+                continue
+    return nested_logs
+
+def get_zip_logs(zip_path, fingerprint, directory=None, zip_file=None):
+    """[name, date, CRC, size] of the log files of a zip: from the date index when the zip did not change, else from
+    its central directory (nothing is decompressed but nested zips), directory being read_zip_directory and zip_file
+    the zip in memory when the caller has them."""
+    logs = indexed_zip_logs(zip_path, fingerprint)
+    if logs is not None:
+        return logs
+    if directory is None:
+        directory = read_zip_directory(zip_path, zip_file)
+    logs, members = directory
+    if logs is None and any(info.filename.endswith('.zip') for info in members):
+        try:
+            with zipfile.ZipFile(zip_file if zip_file is not None else zip_path, 'r') as zip_ref:
+                return list_zip_logs(zip_ref)
+        except (zipfile.BadZipFile, OSError):
+            return []
+    return [[info.filename, date_str, info.CRC, info.file_size] for info, date_str in logs or []]
+
+def log_key(zip_path, name, crc, size):
+    """seen_logs key of a log file of a zip. A log file of a nested zip (<nested zip>/<log file>) has the machine of
+    the nested zip."""
+    nested_zip, _, log_name = name.replace('\\', '/').rpartition('.zip/')
+    _, machine = machine_of_zip(nested_zip + '.zip' if nested_zip else zip_path)
+    return (machine, log_name.split('/')[-1], crc, size)
+
+def plan_duplicate_logs(zip_path, fingerprint, directory=None, zip_file=None):
+    """Names of the log files of the zip (inside the date range) that an earlier zip of the run already had: same
+    machine, file name, CRC and size. Must be called in walk order, the first copy is the one parsed; the zip holds
+    the keys of the others until settle_duplicate_logs, as it can still turn out broken."""
+    if not dedup_logs:
+        return ()
+    run_date_range = get_date_range()
+    skip_logs = {}
+    for name, date_str, crc, size in get_zip_logs(zip_path, fingerprint, directory, zip_file):
+        if date_str not in run_date_range:
+            continue
+        key = log_key(zip_path, name, crc, size)
+        if key in seen_logs:
+            skip_logs[name] = key
+            skipping_logs[key] += 1
+        else:
+            seen_logs[key] = zip_path
+    planned_skips[zip_path] = skip_logs
+    return tuple(skip_logs)
+
+def release_duplicate_logs(zip_path, result):
+    """Give up the keys of the log files a broken (failed or invalid) zip did not parse, so their next copy is parsed:
+    a zip merged later that skips one takes it over (settle_duplicate_logs), else the next zip planned has it."""
+    parsed = {log_key(zip_path, name, crc, size) for name, _, crc, size in result['logs'] + result['nested_logs'] if name not in result['failed_logs']}
+    for key in [key for key, owner in seen_logs.items() if owner == zip_path and key not in parsed]:
+        if skipping_logs[key]:
+            seen_logs[key] = None
+        else:
+            del seen_logs[key]
+
+def settle_duplicate_logs(zip_path, fingerprint, skip_logs, result):
+    """Once the result of a zip is known, in walk order: the keys it did not parse are given up when it is broken,
+    and it is run again to parse the log files it skipped whose first copy was given up that way. Returns the result
+    to merge."""
+    if not dedup_logs:
+        return result
+    skip_keys = planned_skips.pop(zip_path, {})
+    for key in skip_keys.values():
+        skipping_logs[key] -= 1
+        if not skipping_logs[key]:
+            del skipping_logs[key]
+    while True:
+        if 'failed' in result or result['invalid_zip']:
+            release_duplicate_logs(zip_path, result)
+        given_up = [name for name in skip_logs if seen_logs.get(skip_keys[name], zip_path) is None]
+        if not given_up:
+            return result
+        print('\033[93m' + f"Parsing {zip_path} again: {len(given_up)} of its skipped log files were not parsed in the broken zip with their first copy" + '\033[95m')
+        for name in given_up:
+            seen_logs[skip_keys[name]] = zip_path
+        skip_logs = tuple(name for name in skip_logs if name not in given_up)
+        result = run_zip(zip_path, skip_logs=skip_logs)
+        store_zip_result(zip_path, fingerprint, result)
+
+#--------------------------------journal / failures------------------------------
+journal = None          #open journal file of the run
+journal_results = {}    #zip path -> journal entry of the run being resumed
+journal_hits = 0
+
+def get_journal_header(logs_folder):
+    """What a journal can only be resumed with: same folder, error types, date range, dedup setting and shard."""
+    return {'journal': 1, 'folder': os.path.abspath(logs_folder), 'config': get_cache_config_hash(), 'dedup_logs': dedup_logs, 'shard': list(shard) if shard else None}
+
+def open_journal(logs_folder):
+    """Start the journal of the run. With resume_run, the zips of the journal left by an unfinished run with the
+    same settings are loaded first (and kept in the journal), else it starts empty."""
+    global journal
+    global journal_hits
+    journal_results.clear()
+    journal_hits = 0
+    header = get_journal_header(logs_folder)
+    if resume_run and os.path.isfile(journal_location):
+        with open(journal_location, encoding='utf-8') as journal_file:
+            lines = journal_file.read().splitlines()
+        try:
+            old_header = json.loads(lines[0]) if lines else None
+        except json.JSONDecodeError:
+            old_header = None
+        if old_header == header:
+            for line in lines[1:]:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:    #last line cut by the crash
+                    break
+                journal_results[entry['zip_path']] = entry
+            print('\033[94m' + f"resuming: {len(journal_results)} zips done by the previous run" + '\033[0m')
+        else:
+            print('\033[93m' + f"{journal_location} is from a run with other settings, starting from the beginning" + '\033[0m')
+    os.makedirs(os.path.dirname(journal_location), exist_ok=True)
+    journal = open(journal_location, 'w', encoding='utf-8')
+    journal.write(json.dumps(header) + '\n')
+    for entry in journal_results.values():
+        journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    journal.flush()
+
+def close_journal(finished):
+    """A finished run removes its journal, an interrupted one leaves it for --resume."""
+    global journal
+    if journal is None:
+        return
+    journal.close()
+    journal = None
+    journal_results.clear()
+    if finished:
+        os.remove(journal_location)
+    else:
+        print('\033[93m' + f"run stopped early, run again with --resume to go on from {journal_location}" + '\033[0m')
+
+def journal_zip_result(zip_path, fingerprint, result):
+    if journal is None:
+        return
+    entry = {'zip_path': os.path.abspath(zip_path), 'fingerprint': list(fingerprint), 'result': json.loads(encode_zip_result(result))}
+    journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    journal.flush()
+
+def get_journal_result(zip_path, fingerprint, skip_logs):
+    """Result of the zip from the resumed journal, if the zip and the log files skipped in it did not change."""
+    global journal_hits
+    entry = journal_results.get(os.path.abspath(zip_path))
+    if entry is None or entry['fingerprint'] != list(fingerprint) or entry['result']['skipped_logs'] != sorted(skip_logs):
+        return None
+    journal_hits += 1
+    #taken out, the rows get changed by add_zip_result; written again to the new journal
+    del journal_results[os.path.abspath(zip_path)]
+    journal_zip_result(zip_path, fingerprint, entry['result'])
+    return entry['result']
+
+def run_zip(zip_path, zip_file=None, skip_logs=()):
+    """process_zip, isolating the failures of one zip: an OSError is retried zip_retries times (with a growing
+    delay), any other error fails at once. A failed zip gives an empty result with 'failed' set instead of ending the run."""
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            if zip_file is not None:
+                zip_file.seek(0)
+            return process_zip(zip_path, zip_file, skip_logs)
+        except Exception as error:
+            retry = isinstance(error, OSError) and not isinstance(error, FileNotFoundError) and attempts <= zip_retries
+            print('\033[91m' + f"Failed zip file: {zip_path}: {type(error).__name__}: {error}" + (', retrying' if retry else '') + '\033[95m')
+            if retry:
+                time_module.sleep(zip_retry_delay * 2**(attempts - 1))
+                continue
+            result = new_zip_result(zip_path)
+            result['failed'] = {'zip_path': zip_path, 'error': type(error).__name__, 'message': str(error), 'attempts': attempts}
+            return result
+
+def write_failure_report(output_path):
+    """<output>_failures.json with the invalid zips and the zips that failed, when there are any. Returns its path or None."""
+    if not invalid_zip and not failed_zips:
+        return None
+    report_path = os.path.splitext(output_path.rstrip('/\\'))[0] + '_failures.json'
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'invalid_zips': list(invalid_zip),
+        'failed_zips': list(failed_zips)
+    }
+    with open(report_path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=4, ensure_ascii=False)
+    return report_path
+
+#--------------------------------prefetch------------------------------
+class ByteBudget:
+    """Bytes that may be held at once. Something bigger than the whole budget still gets in when nothing else is held."""
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0   #most bytes held at once
+        self.condition = threading.Condition()
+
+    def fits(self, size):
+        return not self.used or self.used + size <= self.limit
+
+    def try_acquire(self, size):
+        with self.condition:
+            if not self.fits(size):
+                return False
+            self.used += size
+            self.peak = max(self.peak, self.used)
+            return True
+
+    def acquire(self, size):
+        with self.condition:
+            while not self.fits(size):
+                self.condition.wait()
+            self.used += size
+            self.peak = max(self.peak, self.used)
+
+    def release(self, size):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+def read_zip_bytes(zip_path):
+    """Read a whole zip (this is where a OneDrive placeholder gets downloaded). None if it cannot be read."""
+    try:
+        with open(zip_path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def prefetch_zips(zip_paths, threads, budget_bytes):
+    """Yield (zip_path, bytes) in order, while the next zips are read by a thread pool as far ahead as the
+    byte budget allows. Zips are admitted in order, so waiting for the next zip never blocks on later ones."""
+    budget = ByteBudget(budget_bytes)
+    pending = collections.deque()
+    next_index = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        while next_index < len(zip_paths) or pending:
+            #read ahead, always at least the next zip
+            while next_index < len(zip_paths):
+                zip_path = zip_paths[next_index]
+                try:
+                    size = os.path.getsize(zip_path)
+                except OSError:
+                    size = 0
+                if not budget.try_acquire(size):
+                    break
+                pending.append((zip_path, size, pool.submit(read_zip_bytes, zip_path)))
+                next_index += 1
+            zip_path, size, future = pending.popleft()
+            yield zip_path, future.result()
+            budget.release(size)
+
+def prefetch_walk_for_zip(logs_folder, threads):
+    """Same as recursive_walk_for_zip, but zips (not in the cache) are read ahead by threads, so the slow
+    reads from network / OneDrive folders overlap with parsing."""
+    with timed_stage('discovery'):
+        zip_paths = [zip_path for zip_path in find_zip_files(logs_folder) if in_shard(zip_path)]
+    print('\033[95m' + f'found {len(zip_paths)} zip files in {logs_folder}, prefetching with {threads} threads' + '\033[0m')
+    print('machine progress%: ', end=" ")
+    checkpoint = 0
+    jobs = []
+    for zip_path in zip_paths:
+        fingerprint = zip_fingerprint(zip_path)
+        jobs.append((zip_path, fingerprint, has_stored_zip_result(zip_path, fingerprint)))
+    #only the zips missing from the cache are fetched; cached results are loaded one at a time while merging, so
+    #a mostly cached run does not hold all of their rows at once
+    fetched = prefetch_zips([zip_path for zip_path, _, stored in jobs if not stored], threads, prefetch_budget_mb*1024*1024)
+    for file_count, (zip_path, fingerprint, stored) in enumerate(jobs, 1):
+        zip_file = None
+        directory = None
+        if not stored:
+            _, data = next(fetched)
+            if data is not None:
+                zip_file = io.BytesIO(data)
+                directory = read_zip_directory(zip_path, zip_file)
+        #planned here, in walk order, from the fetched bytes: a zip is never opened from the folder before its read
+        skip_logs = plan_duplicate_logs(zip_path, fingerprint, directory, zip_file)
+        result = get_cached_zip_result(zip_path, fingerprint, skip_logs)
+        if result is None:
+            #a stored result that did not fit (other skipped log files) is read from the folder
+            result = run_zip(zip_path, zip_file, skip_logs)
+            store_zip_result(zip_path, fingerprint, result)
+        add_zip_result(settle_duplicate_logs(zip_path, fingerprint, skip_logs, result))
+        progress = file_count / len(zip_paths) * 100
+        if math.floor(progress) >= checkpoint:
+            checkpoint += 10
+            print('.', end=" ")
+    print('\033[93m' + '\nnum of library processed:', end=' ')
+    print(len(lib_machines_count) - 1)
+    print('\033[0m')
+
+def get_worker_settings():
+    return {
+        'rule_sets': (error_matcher or get_error_matcher()).rule_sets,
+        'start_date': start_date or default_start_date,
+        'end_date': end_date or default_end_date,
+        'collect_metrics': collect_metrics,
+        'chunk_workers': chunk_workers,
+        'chunk_threshold_mb': chunk_threshold_mb,
+        'memory_budget_mb': memory_budget_mb
+    }
+
+def init_worker(settings):
+    """Worker processes do not run __main__, so settings are handed over from the parent here."""
+    global error_matcher
+    global start_date
+    global end_date
+    global collect_metrics
+    global chunk_workers
+    global chunk_threshold_mb
+    global memory_budget_mb
+    error_matcher = ErrorMatcher(rule_sets=settings['rule_sets'])
+    start_date = settings['start_date']
+    end_date = settings['end_date']
+    collect_metrics = settings['collect_metrics']
+    chunk_workers = settings['chunk_workers']
+    chunk_threshold_mb = settings['chunk_threshold_mb']
+    memory_budget_mb = settings['memory_budget_mb']
+
+def zip_memory_cost(zip_path, directory=None):
+    """Bytes a zip takes in memory while it is processed, from its central directory (nothing is decompressed).
+    Log files are gone through one after the other, so it is the biggest of: two blocks of a streamed log file, a log
+    file read whole for chunked mode, or a nested zip (read whole, twice its size for what it holds). 0 for a zip that
+    cannot be read, it fails straight away. directory is read_zip_directory when the caller has it."""
+    logs, members = directory if directory is not None else read_zip_directory(zip_path)
+    if logs is None:
+        return max((2 * info.file_size for info in members if info.filename.endswith('.zip')), default=0)
+    run_date_range = get_date_range()
+    cost = 0
+    for info, date_str in logs:
+        if date_str in run_date_range:
+            cost = max(cost, info.file_size if chunk_in_memory(info.file_size) else min(info.file_size, 2*log_block_size))
+    return cost
+
+class WorkerPool:
+    """Process pool of a --workers run, started again when a worker process dies (killed for memory, crashed), which
+    breaks the pool and every zip still in it."""
+    def __init__(self, workers):
+        self.workers = workers
+        self.restarts = 0
+        self.pool = self.new_pool()
+
+    def new_pool(self):
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(get_worker_settings(),))
+
+    def submit(self, zip_path, skip_logs):
+        """Future of process_worker_zip. A pool that broke since the last zip does not raise here, the future is a
+        broken one, handled like the zips the pool was running (is_broken)."""
+        try:
+            return self.pool.submit(process_worker_zip, zip_path, skip_logs)
+        except concurrent.futures.process.BrokenProcessPool as error:
+            future = concurrent.futures.Future()
+            future.set_exception(error)
+            return future
+
+    def restart(self):
+        self.pool.shutdown()
+        self.pool = self.new_pool()
+        self.restarts += 1
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+def is_broken(future):
+    """A future of a pool that broke before giving its result."""
+    return future.done() and (future.cancelled() or isinstance(future.exception(), concurrent.futures.process.BrokenProcessPool))
+
+def rerun_broken_zip(zip_path, skip_logs, pending, pool):
+    """Result of a zip whose pool broke. The pool is started again and the zip runs alone in it, so a zip that kills
+    its worker again gets a failed result (listed in the failure report) instead of ending the run; the other zips the
+    broken pool had are submitted again afterwards."""
+    pool.restart()
+    try:
+        result = pool.submit(zip_path, skip_logs).result()
+    except concurrent.futures.process.BrokenProcessPool:
+        print('\033[91m' + f"Failed zip file: {zip_path}: its worker process died twice (out of memory or crashed)" + '\033[95m')
+        pool.restart()
+        result = new_zip_result(zip_path)
+        result['failed'] = {'zip_path': zip_path, 'error': 'BrokenProcessPool', 'message': 'worker process died', 'attempts': 2}
+    resubmit_broken_zips(pending, pool)
+    return result
+
+def resubmit_broken_zips(pending, pool):
+    """Submit the pending zips of a broken pool again, to the pool started since."""
+    for i, (zip_path, fingerprint, future, cost, skip_logs) in enumerate(pending):
+        if isinstance(future, concurrent.futures.Future) and is_broken(future):
+            pending[i] = (zip_path, fingerprint, pool.submit(zip_path, skip_logs), cost, skip_logs)
+
+def finish_next_zip(pending, budget, pool):
+    """Yield the oldest pending zip as (zip_path, result), waiting for its worker if needed; its memory goes back to
+    the budget once the caller has merged it."""
+    zip_path, fingerprint, result, cost, skip_logs = pending.popleft()
+    if isinstance(result, concurrent.futures.Future):
+        try:
+            result = result.result()
+        except concurrent.futures.process.BrokenProcessPool:
+            result = rerun_broken_zip(zip_path, skip_logs, pending, pool)
+        store_zip_result(zip_path, fingerprint, result)
+    yield zip_path, settle_duplicate_logs(zip_path, fingerprint, skip_logs, result)
+    budget.release(cost)
+
+def schedule_zips(zip_paths, pool, workers, budget):
+    """Yield (zip_path, result) in walk order, from the cache or from the pool. A zip missing from the cache is only
+    submitted once its zip_memory_cost fits in the budget (the zips before it are merged meanwhile), and no more than
+    a few zips per worker wait to be merged, so neither the workers nor the results outgrow the memory."""
+    pending = collections.deque()   #(zip_path, fingerprint, result or future, cost, skip_logs) in walk order
+    for zip_path in zip_paths:
+        fingerprint = zip_fingerprint(zip_path)
+        #one read of the central directory gives both the dedup keys and the memory cost (none for indexed zips)
+        directory = read_zip_directory(zip_path) if indexed_zip_logs(zip_path, fingerprint) is None else None
+        skip_logs = plan_duplicate_logs(zip_path, fingerprint, directory)
+        result = get_cached_zip_result(zip_path, fingerprint, skip_logs)
+        cost = 0
+        if result is None:
+            cost = zip_memory_cost(zip_path, directory)
+            while not budget.try_acquire(cost):
+                yield from finish_next_zip(pending, budget, pool)
+            result = pool.submit(zip_path, skip_logs)
+        pending.append((zip_path, fingerprint, result, cost, skip_logs))
+        if isinstance(result, concurrent.futures.Future) and is_broken(result):
+            #the pool broke while zips were being submitted: a new one takes the zips in flight and this one
+            pool.restart()
+            resubmit_broken_zips(pending, pool)
+        #merge what is already done, and wait when too many zips are ahead of the merge
+        while pending and (len(pending) >= workers * 4 or not isinstance(pending[0][2], concurrent.futures.Future) or pending[0][2].done()):
+            yield from finish_next_zip(pending, budget, pool)
+    while pending:
+        yield from finish_next_zip(pending, budget, pool)
+
+def parallel_walk_for_zip(logs_folder, workers):
+    """Same as recursive_walk_for_zip, but every zip is processed in a pool of worker processes (schedule_zips),
+    and merged in walk order, so the boot matching is the same as a serial run."""
+    with timed_stage('discovery'):
+        zip_paths = [zip_path for zip_path in find_zip_files(logs_folder) if in_shard(zip_path)]
+    print('\033[95m' + f'found {len(zip_paths)} zip files in {logs_folder}, processing with {workers} workers' + '\033[0m')
+    print('machine progress%: ', end=" ")
+    checkpoint = 0
+    budget = ByteBudget(memory_budget_mb*1024*1024)
+    pool = WorkerPool(workers)
+    try:
+        for file_count, (zip_path, result) in enumerate(schedule_zips(zip_paths, pool, workers, budget), 1):
+            add_zip_result(result)
+            progress = file_count / len(zip_paths) * 100
+            if math.floor(progress) >= checkpoint:
+                checkpoint += 10
+                print('.', end=" ")
+    finally:
+        pool.shutdown()
+    if pool.restarts:
+        print('\033[93m' + f'\nworker pool started again {pool.restarts} times after a worker process died' + '\033[0m', end='')
+    print('\033[93m' + '\nnum of library processed:', end=' ')
+    print(len(lib_machines_count) - 1)
+    print(f'most zip memory in the workers at once (estimated): {budget.peak / 1024**2:.1f} MB of {memory_budget_mb} MB')
+    print('\033[0m')
+
+
+#--------------------------------chunked mode------------------------------
+chunk_pool = None   #created at the first big log file, kept for the run
+
+def use_chunks(size):
+    return chunk_workers > 1 and size >= chunk_threshold_mb * 1024**2
+
+def chunk_in_memory(size):
+    """A log file inside a zip is read whole for chunked mode, unless it is bigger than the memory budget."""
+    return use_chunks(size) and size <= memory_budget_mb * 1024**2
+
+def get_chunk_pool():
+    global chunk_pool
+    if chunk_pool is None:
+        chunk_pool = concurrent.futures.ProcessPoolExecutor(max_workers=chunk_workers, initializer=init_worker, initargs=(get_worker_settings(),))
+    return chunk_pool
+
+def process_worker_zip(zip_path, skip_logs=()):
+    """process_zip in a --workers process. The chunk pool of its big log files is not kept for the next zip,
+    a worker process with a pool of its own left open never exits."""
+    try:
+        return run_zip(zip_path, skip_logs=skip_logs)
+    finally:
+        close_chunk_pool()
+
+def close_chunk_pool():
+    global chunk_pool
+    if chunk_pool is not None:
+        chunk_pool.shutdown()
+        chunk_pool = None
+
+def chunk_boundaries(buffer, size, pieces, start=0):
+    """(start, end) of about `pieces` pieces of buffer from start, every piece but the last ending right
+    after a newline. A CRLF is never cut and a newline byte is never part of a utf-8 or gb18030 character, so the
+    pieces decode and split into the same lines as the whole file."""
+    step = max(1, (size - start) // pieces)
+    bounds = []
+    while start < size:
+        end = buffer.find(b'\n', min(start + step, size) - 1) + 1
+        if end == 0:
+            end = size
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+def match_log_chunk(chunk, date_str, library, machine, encoding):
+    """Worker side of process_log_chunked: match_log_lines of one piece (bytes). The piece is sniffed when the start
+    of the file did not tell the encoding. Returns (rows, undecodable bytes)."""
+    counters = new_log_counters()
+    rows = match_log_buffer(chunk, date_str, library, machine, encoding or sniff_log_encoding(chunk) or 'utf-8', counters)
+    return rows, counters['undecodable_bytes']
+
+def process_log_chunked(source, date_str, library, machine, counters=None):
+    """process_log_lines for one big log file read from its zip, source being its bytes. The file is cut at newlines,
+    the pieces are matched in the chunk pool and the boots are labelled afterwards in one pass over the rows in line
+    order, so the rows are the same as process_log_lines gives. counters as in match_log_stream, but the lines."""
+    pieces = chunk_workers * 4     #a few pieces per process, so a slow piece does not hold the others
+    head = source[:log_block_size]
+    encoding, skip = log_bom(head)
+    chunks = [source[start:end] for start, end in chunk_boundaries(source, len(source), pieces, skip)]
+    encoding = encoding or sniff_log_encoding(head[skip:head.rfind(b'\n') + 1])
+    count = len(chunks)
+    data = []
+    undecodable_bytes = 0
+    for rows, undecodable in get_chunk_pool().map(match_log_chunk, chunks, [date_str]*count, [library]*count, [machine]*count, [encoding]*count):
+        data.extend(rows)
+        undecodable_bytes += undecodable
+    if counters is not None:
+        counters['undecodable_bytes'] += undecodable_bytes
+        counters['encoding'] = encoding or 'ascii'
+    classify_boots(data)
+    return data
+
+
+#--------------------------------metrics------------------------------
+collect_metrics = False     #also set in the workers
+run_metrics = None          #only in the main process
+
+def new_zip_metrics(zip_path):
+    return {
+        'zip_path': zip_path,
+        'pid': os.getpid(),
+        'start': time_module.time(),
+        'seconds': 0,
+        'bytes': 0,
+        'lines': 0,
+        'undecodable_bytes': 0,
+        'matched': {},
+        'log_files': []
+    }
+
+def measured_process_log_stream(zip_metrics, info, binary, date_str, library, machine):
+    """process_log_stream, also recording time, bytes, lines, encoding and matches of the log file into zip_metrics."""
+    start = time_module.time()
+    counters = new_log_counters()
+    data = process_log_stream(binary, date_str, library, machine, counters)
+    add_log_file_metrics(zip_metrics, info, start, counters, data)
+    return data
+
+def measured_process_log_chunked(zip_metrics, info, source, date_str, library, machine):
+    """process_log_chunked with the same metrics as measured_process_log_stream."""
+    start = time_module.time()
+    counters = new_log_counters()
+    data = process_log_chunked(source, date_str, library, machine, counters)
+    counters['lines'] = source.count(b'\n') + (source[-1:] not in (b'', b'\n'))     #last line may have no newline
+    add_log_file_metrics(zip_metrics, info, start, counters, data)
+    return data
+
+def add_log_file_metrics(zip_metrics, info, start, counters, data):
+    for parsed in data:
+        zip_metrics['matched'][parsed['Error Type']] = zip_metrics['matched'].get(parsed['Error Type'], 0) + 1
+    zip_metrics['bytes'] += info.file_size
+    zip_metrics['lines'] += counters['lines']
+    zip_metrics['undecodable_bytes'] += counters['undecodable_bytes']
+    zip_metrics['log_files'].append({
+        'log_file': info.filename,
+        'start': start,
+        'seconds': time_module.time() - start,
+        'bytes': info.file_size,
+        'lines': counters['lines'],
+        'encoding': counters['encoding'],
+        'undecodable_bytes': counters['undecodable_bytes'],
+        'rows': len(data)
+    })
+
+def finish_zip_metrics(zip_metrics, result):
+    """Close the metrics of a zip (nested zips are added into it) and put them in the result."""
+    for nested in result.pop('nested_metrics', []):
+        zip_metrics['bytes'] += nested['bytes']
+        zip_metrics['lines'] += nested['lines']
+        zip_metrics['undecodable_bytes'] += nested['undecodable_bytes']
+        for error, count in nested['matched'].items():
+            zip_metrics['matched'][error] = zip_metrics['matched'].get(error, 0) + count
+        zip_metrics['log_files'].extend(nested['log_files'])
+    zip_metrics['seconds'] = time_module.time() - zip_metrics['start']
+    result['metrics'] = zip_metrics
+
+def start_run_metrics():
+    global collect_metrics
+    global run_metrics
+    collect_metrics = bool(metrics_out or trace_out)
+    run_metrics = {'start': time_module.time(), 'stages': {}, 'zips': [], 'trace': []} if collect_metrics else None
+
+def add_trace_event(name, category, start, seconds, pid=None, args=None):
+    """Chrome trace format ("X" = complete event, times in microseconds), open it in chrome://tracing or ui.perfetto.dev"""
+    event = {'name': name, 'cat': category, 'ph': 'X', 'ts': round(start * 1e6), 'dur': round(seconds * 1e6),
+             'pid': pid or os.getpid(), 'tid': pid or os.getpid()}
+    if args:
+        event['args'] = args
+    run_metrics['trace'].append(event)
+
+@contextlib.contextmanager
+def timed_stage(stage):
+    """Add the wall time of the block to a run stage (does nothing when metrics are off)."""
+    if run_metrics is None:
+        yield
+        return
+    start = time_module.time()
+    try:
+        yield
+    finally:
+        seconds = time_module.time() - start
+        run_metrics['stages'][stage] = run_metrics['stages'].get(stage, 0) + seconds
+        add_trace_event(stage, 'stage', start, seconds)
+
+def add_zip_metrics(result):
+    zip_metrics = result.get('metrics')
+    if zip_metrics is None:     #served from the cache / skipped by the date index
+        run_metrics['zips'].append({'zip_path': result['zip_path'], 'cached': True})
+        return
+    zip_metrics['cached'] = False
+    run_metrics['zips'].append(zip_metrics)
+    add_trace_event(os.path.basename(result['zip_path']), 'zip', zip_metrics['start'], zip_metrics['seconds'], zip_metrics['pid'],
+                    {'bytes': zip_metrics['bytes'], 'lines': zip_metrics['lines']})
+    for log_file in zip_metrics['log_files']:
+        add_trace_event(log_file['log_file'], 'log_file', log_file['start'], log_file['seconds'], zip_metrics['pid'],
+                        {'lines': log_file['lines'], 'rows': log_file['rows']})
+
+def write_run_metrics():
+    global run_metrics
+    global collect_metrics
+    if run_metrics is None:
+        return
+    parsed_zips = [zip_metrics for zip_metrics in run_metrics['zips'] if not zip_metrics['cached']]
+    log_files = [dict(log_file, zip_path=zip_metrics['zip_path']) for zip_metrics in parsed_zips for log_file in zip_metrics['log_files']]
+    matched = {}
+    for zip_metrics in parsed_zips:
+        for error, count in zip_metrics['matched'].items():
+            matched[error] = matched.get(error, 0) + count
+    if metrics_out:
+        report = {
+            'seconds': time_module.time() - run_metrics['start'],
+            'stages': run_metrics['stages'],
+            'zips': len(run_metrics['zips']),
+            'zips_parsed': len(parsed_zips),
+            'cache_hits': cache_hits,
+            'zips_skipped_by_date': date_index_skips,
+            'duplicate_logs_skipped': duplicate_logs_skipped,
+            'invalid_zips': len(invalid_zip),
+            'failed_zips': len(failed_zips),
+            'bytes_decompressed': sum(zip_metrics['bytes'] for zip_metrics in parsed_zips),
+            'lines_scanned': sum(zip_metrics['lines'] for zip_metrics in parsed_zips),
+            'undecodable_bytes': sum(zip_metrics['undecodable_bytes'] for zip_metrics in parsed_zips),
+            'log_encodings': dict(collections.Counter(log_file['encoding'] for log_file in log_files)),
+            'log_files_with_undecodable_bytes': [{key: log_file[key] for key in ('zip_path', 'log_file', 'encoding', 'undecodable_bytes')}
+                                                 for log_file in log_files if log_file['undecodable_bytes']],
+            'lines_matched': matched,
+            'slowest_zips': [{key: zip_metrics[key] for key in ('zip_path', 'seconds', 'bytes', 'lines')}
+                             for zip_metrics in sorted(parsed_zips, key=lambda zip_metrics: -zip_metrics['seconds'])[:metrics_top_n]],
+            'slowest_log_files': [{key: log_file[key] for key in ('zip_path', 'log_file', 'seconds', 'bytes', 'lines')}
+                                  for log_file in sorted(log_files, key=lambda log_file: -log_file['seconds'])[:metrics_top_n]],
+            'per_zip': [{key: value for key, value in zip_metrics.items() if key != 'log_files'} for zip_metrics in run_metrics['zips']]
+        }
+        with open(metrics_out, 'w', encoding='utf-8') as json_file:
+            json.dump(report, json_file, indent=4, ensure_ascii=False)
+        print('\033[94m' + f"run metrics written to {metrics_out}" + '\033[0m')
+    if trace_out:
+        with open(trace_out, 'w', encoding='utf-8') as json_file:
+            json.dump({'traceEvents': run_metrics['trace']}, json_file)
+        print('\033[94m' + f"chrome trace written to {trace_out}" + '\033[0m')
+    run_metrics = None
+    collect_metrics = False
+
+def profile_run(function, profile_path=None, *args, **kwargs):
+    """Run function under cProfile, print the 30 slowest functions (cumulative) and optionally save the stats."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(30)
+        if profile_path:
+            profiler.dump_stats(profile_path)
+            print('\033[94m' + f"cProfile stats written to {profile_path} (open with python -m pstats or snakeviz)" + '\033[0m')
+
+#--------------------------------follow mode------------------------------
+class EventSink:
+    """Append-only output of follow mode, picked by extension: .csv, .jsonl or .sqlite/.db"""
+    def __init__(self, path):
+        self.path = path
+        self.kind = os.path.splitext(path)[1].lower()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.kind in ('.sqlite', '.db'):
+            self.connection = sqlite3.connect(path)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS events (library TEXT, machine TEXT, date TEXT, time TEXT, error_type TEXT)')
+        elif self.kind in ('.csv', '.jsonl'):
+            new_file = not os.path.isfile(path) or os.path.getsize(path) == 0
+            self.file = open(path, 'a', encoding='utf-8', newline='')
+            if self.kind == '.csv':
+                self.writer = csv.writer(self.file)
+                if new_file:
+                    self.writer.writerow(error_cols)
+        else:
+            raise ValueError(f'unknown sink type {self.kind}, use .csv, .jsonl or .sqlite')
+
+    def write_rows(self, rows):
+        """rows are tuples in error_cols order (EventStore.iter_rows), flushed right away."""
+        if self.kind in ('.sqlite', '.db'):
+            self.connection.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?)', rows)
+            self.connection.commit()
+            return
+        for values in rows:
+            if self.kind == '.csv':
+                self.writer.writerow(values)
+            else:
+                self.file.write(json.dumps(dict(zip(error_cols, values)), ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.kind in ('.sqlite', '.db'):
+            self.connection.close()
+        else:
+            self.file.close()
+
+def machine_of_log_path(filepath):
+    """Machine of an unzipped log: the folder holding the Log folder (e.g. YT-GFK-PAK1/Log/2025-06-06_local.log)."""
+    folder = os.path.dirname(os.path.abspath(filepath))
+    while os.path.basename(folder) != 'Log':
+        parent = os.path.dirname(folder)
+        if parent == folder:    #no Log folder, use the folder of the file
+            return machine_of_name(os.path.basename(os.path.dirname(os.path.abspath(filepath))))
+        folder = parent
+    return machine_of_name(os.path.basename(os.path.dirname(folder)))
+
+def load_follow_checkpoint(path):
+    if not os.path.isfile(path):
+        return {'files': {}, 'pending': {}, 'latest_date': {}}
+    with open(path, encoding='utf-8') as json_file:
+        return json.load(json_file)
+
+def save_follow_checkpoint(path, checkpoint):
+    """Written to a temp file first, so a crash never leaves half a checkpoint."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    checkpoint['pending'] = abnormal_boot_list
+    with open(path + '.tmp', 'w', encoding='utf-8') as json_file:
+        json.dump(checkpoint, json_file, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+def follow_log_file(filepath, date_str, checkpoint):
+    """Classify the lines appended to a log file since the last poll. Returns True if anything was read."""
+    state = checkpoint['files'].get(filepath)
+    size = os.path.getsize(filepath)
+    if state is None or size < state['offset']:     #new file, or truncated / replaced: start over
+        state = {'offset': 0, 'last_indicator': None, 'booted': False, 'encoding': None}
+        checkpoint['files'][filepath] = state
+    if size == state['offset']:
+        return False
+    with open(filepath, 'rb') as f:
+        f.seek(state['offset'])
+        data = f.read(size - state['offset'])
+    #only whole lines, a line still being written is read at the next poll
+    end = data.rfind(b'\n') + 1
+    if end == 0:
+        return False
+    library, machine = machine_of_log_path(filepath)
+    skip = 0
+    if state['offset'] == 0:
+        state['encoding'], skip = log_bom(data)
+    #the encoding is kept once the file has more than ascii
+    state['encoding'] = state.get('encoding') or sniff_log_encoding(data[skip:end])
+    log_data = match_log_buffer(data[skip:end], date_str, library, machine, state['encoding'] or 'utf-8')
+    #boot labels carry on from the lines read at the previous polls
+    state['last_indicator'], state['booted'] = classify_boots(log_data, (state['last_indicator'], state['booted']))
+    add_log_data(log_data)
+    state['offset'] += end
+    latest_date = checkpoint['latest_date'].get(machine)
+    if latest_date is None or date_str > latest_date:
+        checkpoint['latest_date'][machine] = date_str
+    return True
+
+def add_finished_days(checkpoint):
+    """Abnormal boots wait for a remote restart of the same day; once the machine logs a newer day they are final."""
+    for machine in abnormal_boot_list:
+        for date in list(abnormal_boot_list[machine]):
+            if date < checkpoint['latest_date'].get(machine, date):
+                add_pending_day(abnormal_boot_list[machine].pop(date))
+
+def follow_logs(log_folder, sink_path, checkpoint_path=None, poll_interval=None):
+    """Watch an unzipped log folder and send the events of newly appended lines to sink_path until Ctrl+C.
+    The offset and boot state of every file are checkpointed, so a restart goes on where it stopped. Edited rule
+    sets / error types are used for the lines appended after the edit, broken ones are reported and the old kept."""
+    checkpoint_path = checkpoint_path or follow_checkpoint_location
+    poll_interval = poll_interval or follow_poll_interval
+    reset_run_state()
+    get_error_matcher()
+    run_date_range = get_date_range()
+    checkpoint = load_follow_checkpoint(checkpoint_path)
+    abnormal_boot_list.update(checkpoint['pending'])
+    sink = EventSink(sink_path)
+    rules_error = None
+    print('\033[95m' + f'following {log_folder} -> {sink_path} (Ctrl+C to stop)' + '\033[0m')
+    try:
+        while True:
+            changed = False
+            matcher = error_matcher
+            try:
+                if get_error_matcher() is not matcher:
+                    print('\033[94m' + f'{today_clock()} rule sets changed, new lines are matched with them' + '\033[0m')
+                rules_error = None
+            except (ValueError, OSError) as error:
+                if str(error) != rules_error:
+                    print('\033[91m' + f'Failure: rule sets not reloaded, still using the previous ones: {error}' + '\033[0m')
+                rules_error = str(error)
+            for root, _folder, files in os.walk(log_folder):
+                for log_file in sorted(files):
+                    date_str = log_file_date(log_file)
+                    if date_str and date_str in run_date_range:
+                        changed = follow_log_file(os.path.join(root, log_file), date_str, checkpoint) or changed
+            if changed:
+                add_finished_days(checkpoint)
+                if len(all_local_error_logs):
+                    sink.write_rows(all_local_error_logs.iter_rows())
+                    print('\033[94m' + f'{today_clock()} {len(all_local_error_logs)} new events' + '\033[0m')
+                    all_local_error_logs.clear()
+                #after the sink, so a crash in between repeats events instead of losing them
+                save_follow_checkpoint(checkpoint_path, checkpoint)
+            time_module.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print('\033[93m' + 'stopped following' + '\033[0m')
+    finally:
+        sink.close()
+
+def today_clock():
+    return datetime.datetime.now().strftime('%H:%M:%S')
+
+#--------------------------------streaming excel------------------------------
+output_stream = None
+
+#columns of the sqlite / parquet outputs (and of the follow mode sqlite sink), error_cols in the same order
+store_columns = ('library', 'machine', 'date', 'time', 'error_type')
+
+def output_kind(path):
+    """Output backend picked by extension: 'sqlite' (.sqlite/.db), 'parquet' (.parquet folder) or 'xlsx'."""
+    extension = os.path.splitext(path.rstrip('/\\'))[1].lower()
+    if extension in ('.sqlite', '.db'):
+        return 'sqlite'
+    if extension == '.parquet':
+        return 'parquet'
+    return 'xlsx'
+
+def open_output_stream(path):
+    kind = output_kind(path)
+    if kind == 'sqlite':
+        return SqliteEventWriter(path)
+    if kind == 'parquet':
+        return ParquetEventWriter(path)
+    return StreamingExcelWriter(path)
+
+class StreamingExcelWriter:
+    """Writes rows straight into the xlsx with xlsxwriter constant_memory (memory stays flat), going on in a
+    new sheet (Error_Logs_2, Error_Logs_3, ...) when a sheet hits the Excel row limit."""
+    max_rows = 1048576
+
+    def __init__(self, output_excel, sheet_name='Error_Logs', columns=error_cols):
+        import xlsxwriter
+        self.workbook = xlsxwriter.Workbook(output_excel, {'constant_memory': True})
+        #same header look as pandas to_excel
+        self.header_format = self.workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        self.sheet_name = sheet_name
+        self.columns = columns
+        self.sheet = None
+        self.sheet_count = 0
+        self.row = 0
+        self.rows_written = 0
+
+    def new_sheet(self):
+        self.sheet_count += 1
+        name = self.sheet_name if self.sheet_count == 1 else f'{self.sheet_name}_{self.sheet_count}'
+        self.sheet = self.workbook.add_worksheet(name)
+        self.sheet.write_row(0, 0, self.columns, self.header_format)
+        self.row = 1
+
+    def write_rows(self, rows):
+        """rows are tuples of text in column order (EventStore.iter_rows)."""
+        for values in rows:
+            if self.sheet is None or self.row >= self.max_rows:
+                self.new_sheet()
+            self.sheet.write_row(self.row, 0, values)
+            self.row += 1
+            self.rows_written += 1
+
+    def write_sheet(self, name, columns, rows):
+        """A whole extra sheet (the summary sheets), after the rows of the sheets before it."""
+        sheet = self.workbook.add_worksheet(name)
+        sheet.write_row(0, 0, columns, self.header_format)
+        for row, values in enumerate(rows, 1):
+            sheet.write_row(row, 0, values)
+
+    def close(self):
+        self.workbook.close()
+
+class SqliteEventWriter:
+    """Rows into the events table of a new sqlite database, indexed for the usual questions (query.py):
+    by library, machine or error type over a date range. Indexes are built at close, inserting is faster without."""
+    indexes = (('library', 'date'), ('machine', 'date'), ('error_type', 'date'), ('date',))
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.isfile(path):    #every run writes a new output, like the xlsx
+            os.remove(path)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(f'CREATE TABLE events ({", ".join(column + " TEXT" for column in store_columns)})')
+        self.rows_written = 0
+
+    def write_rows(self, rows):
+        """rows are tuples of text in error_cols order (EventStore.iter_rows)."""
+        cursor = self.connection.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?)', rows)
+        self.rows_written += cursor.rowcount
+
+    def close(self):
+        for columns in self.indexes:
+            self.connection.execute(f'CREATE INDEX events_{"_".join(columns)} ON events ({", ".join(columns)})')
+        self.connection.commit()
+        self.connection.close()
+
+class ParquetEventWriter:
+    """Rows into a parquet dataset folder partitioned by library and date (library=LIB/date=2025-06-06/*.parquet),
+    so a query on some libraries or days only reads their files. Needs pyarrow."""
+    rows_per_write = 500000
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('parquet output needs pyarrow (pip install pyarrow), or use a .sqlite output')
+        self.pyarrow = pyarrow
+        self.path = path
+        if os.path.isdir(path):     #every run writes a new output, like the xlsx
+            import shutil
+            shutil.rmtree(path)
+        os.makedirs(path)
+        self.rows = []
+        self.writes = 0
+        self.rows_written = 0
+
+    def write_rows(self, rows):
+        """rows are tuples of text in error_cols order (EventStore.iter_rows), written in files of rows_per_write rows."""
+        self.rows.extend(rows)
+        if len(self.rows) >= self.rows_per_write:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = self.pyarrow.table({column: [values[i] for values in self.rows] for i, column in enumerate(store_columns)})
+        self.pyarrow.parquet.write_to_dataset(table, self.path, partition_cols=['library', 'date'],
+                                              basename_template=f'part-{self.writes}-{{i}}.parquet')
+        self.writes += 1
+        self.rows_written += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+
+class RunSummary:
+    """Counts kept while the events are added (add_event) and written as summary sheets at the end, so the usual
+    pivot tables need no second pass over the rows, nor the rows themselves (--no-raw-rows)."""
+    boot_types = ('First boot', 'Normal boot', 'Abnormal boot', 'scheduled boot')
+
+    def __init__(self):
+        self.library_errors = collections.Counter()     #(library, error type)
+        self.machine_days = collections.Counter()       #(library, machine, date)
+        self.machine_boots = collections.Counter()      #(library, machine, boot type)
+        self.machines = {}  #(library, machine) of every machine zip, with events or not
+
+    def add(self, parsed):
+        library, machine, error_type = parsed['Library'], parsed['Machine'], parsed['Error Type']
+        self.library_errors[library, error_type] += 1
+        self.machine_days[library, machine, parsed['Date']] += 1
+        if error_type in self.boot_types:
+            self.machine_boots[library, machine, error_type] += 1
+
+    def add_machines(self, machines):
+        for library, machine in machines:
+            self.machines[library, machine] = True
+
+    def error_type_order(self, error_types):
+        """Columns in the order of the error types, the boot ones being split into their labels, then any other seen."""
+        boot_rules = (error_matcher or get_error_matcher()).boot_types
+        order = []
+        for error_type in error_types:
+            order.extend(self.boot_types if error_type in boot_rules else (error_type,))
+        order = list(dict.fromkeys(order))
+        seen = {error_type for _, error_type in self.library_errors}
+        return [error_type for error_type in order if error_type in seen] + sorted(seen - set(order))
+
+    def all_machines(self):
+        return sorted(set(self.machines) | {(library, machine) for library, machine, _ in self.machine_days})
+
+    def sheets(self, error_types, machine_counts):
+        """(sheet name, columns, rows) of every summary sheet. machine_counts is lib_machines_count."""
+        sheets = []
+
+        columns = self.error_type_order(error_types)
+        libraries = sorted({library for library, _ in self.library_errors})
+        rows = []
+        for library in libraries:
+            counts = [self.library_errors.get((library, error_type), 0) for error_type in columns]
+            rows.append([library] + counts + [sum(counts)])
+        totals = [sum(self.library_errors.get((library, error_type), 0) for library in libraries) for error_type in columns]
+        rows.append(['all library'] + totals + [sum(totals)])
+        sheets.append(('Library x Error Type', ['Library'] + columns + ['Total'], rows))
+
+        machines = self.all_machines()
+        days = sorted({date for _, _, date in self.machine_days})
+        rows = []
+        for library, machine in machines:
+            counts = [self.machine_days.get((library, machine, date), 0) for date in days]
+            rows.append([library, machine] + counts + [sum(counts)])
+        sheets.append(('Machine x Day', ['Library', 'Machine'] + days + ['Total'], rows))
+
+        rows = []
+        for library, machine in machines:
+            boots = sum(self.machine_boots.get((library, machine, boot_type), 0) for boot_type in self.boot_types)
+            abnormal = self.machine_boots.get((library, machine, 'Abnormal boot'), 0)
+            rows.append([library, machine, boots, abnormal, round(abnormal / boots, 4) if boots else None])
+        sheets.append(('Abnormal Boot Rate', ['Library', 'Machine', 'Boots', 'Abnormal boots', 'Abnormal boot rate'], rows))
+
+        #lib_machines_count counts machine zips, a machine exported twice (two export folders) is one machine here
+        active = {(library, machine) for library, machine, _ in self.machine_days}
+        named = collections.Counter(library for library, _ in machines)
+        with_events = collections.Counter(library for library, _ in active)
+        rows = []
+        for library, zips in machine_counts.items():
+            if library == 'all library':
+                continue
+            without = named[library] - with_events[library]
+            rows.append([library, zips, named[library], with_events[library], without, round(without / named[library], 4) if named[library] else None])
+        sheets.append(('Machines', ['Library', 'Machine zips', 'Machines', 'Machines with events', 'Machines without events', 'Share without events'], rows))
+
+        rows = [[library, machine] for library, machine in sorted(self.machines) if (library, machine) not in active]
+        sheets.append(('Zero Event Machines', ['Library', 'Machine'], rows))
+        return sheets
+
+#--------------------------------event history------------------------------
+anomaly_columns = ['Library', 'Machine', 'Date', 'Error Type', 'Count', 'Baseline', 'Z-score']
+
+class EventHistory:
+    """Per machine / day / error type counts of the run (add_event), added to the history store at the end (save).
+    Every (machine, error type) has an EWMA baseline (mean, variance) in the store with the last day it went through,
+    so a run only walks its own new days. Going back to days already walked (a re-run of the same dates, a late
+    export) or a new error type of a machine rebuilds the baselines of that machine from its stored counts."""
+
+    def __init__(self):
+        self.counts = collections.Counter()     #(library, machine, date, error type)
+        self.days = set()   #(library, machine, date) with a log file in the run, days without events count as 0
+        self.anomalies = []     #of the days of the run, set by save
+
+    def add(self, parsed):
+        self.counts[parsed['Library'], parsed['Machine'], parsed['Date'], parsed['Error Type']] += 1
+
+    def add_days(self, days):
+        for library, machine, date in days:
+            self.days.add((library, machine, date))
+
+    def machine_dates(self):
+        """{(library, machine): sorted dates} of the run."""
+        dates = collections.defaultdict(set)
+        for library, machine, date in self.days | {key[:3] for key in self.counts}:
+            dates[library, machine].add(date)
+        return {key: sorted(machine_days) for key, machine_days in dates.items()}
+
+    def save(self, path=None):
+        """Store the counts of the run, bring the baselines up to date and return the anomalies of the days of the
+        run (anomaly_columns rows)."""
+        connection = open_history(path or history_location)
+        run_anomalies = []
+        try:
+            with connection:
+                changed_settings = check_history_settings(connection)
+                run_dates = self.machine_dates()
+                machine_counts = collections.defaultdict(dict)  #(library, machine) -> {(date, error type): count}
+                for (library, machine, date, error_type), count in self.counts.items():
+                    machine_counts[library, machine][date, error_type] = count
+                for (library, machine), dates in run_dates.items():
+                    day_counts = machine_counts[library, machine]
+                    rebuild = store_machine_days(connection, library, machine, dates, day_counts)
+                    if rebuild or changed_settings:
+                        rebuild_machine_baselines(connection, library, machine)
+                    else:
+                        update_machine_baselines(connection, library, machine, dates, day_counts)
+                    run_anomalies.extend(get_machine_anomalies(connection, library, machine, dates))
+                if changed_settings:
+                    #the other machines of the store follow the new settings too
+                    for library, machine in connection.execute('SELECT DISTINCT library, machine FROM machine_days').fetchall():
+                        if (library, machine) not in run_dates:
+                            rebuild_machine_baselines(connection, library, machine)
+        finally:
+            connection.close()
+        self.anomalies = sorted(run_anomalies)
+        return self.anomalies
+
+def open_history(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS machine_days (library TEXT, machine TEXT, date TEXT, PRIMARY KEY (library, machine, date));
+        CREATE TABLE IF NOT EXISTS daily_counts (library TEXT, machine TEXT, date TEXT, error_type TEXT, count INTEGER,
+                                                 PRIMARY KEY (library, machine, date, error_type));
+        CREATE TABLE IF NOT EXISTS baselines (library TEXT, machine TEXT, error_type TEXT, last_date TEXT, days INTEGER,
+                                              mean REAL, variance REAL, PRIMARY KEY (library, machine, error_type));
+        CREATE TABLE IF NOT EXISTS anomalies (library TEXT, machine TEXT, date TEXT, error_type TEXT, count INTEGER,
+                                              baseline REAL, z_score REAL, PRIMARY KEY (library, machine, date, error_type));
+        CREATE TABLE IF NOT EXISTS history_settings (settings TEXT);
+    ''')
+    return connection
+
+def check_history_settings(connection):
+    """Store the baseline settings, True when they differ from the ones the stored baselines were made with."""
+    settings = json.dumps([history_span_days, anomaly_z, anomaly_min_count, anomaly_min_days, sorted(anomaly_ignore_types)])
+    row = connection.execute('SELECT settings FROM history_settings').fetchone()
+    if row is not None and row[0] == settings:
+        return False
+    connection.execute('DELETE FROM history_settings')
+    connection.execute('INSERT INTO history_settings VALUES (?)', (settings,))
+    return row is not None
+
+def store_machine_days(connection, library, machine, dates, day_counts):
+    """Replace the counts of these days of the machine. True when the baselines of the machine cannot just go on
+    with them: a day not after the last one walked, or an error type the machine never had."""
+    key = (library, machine)
+    for date in dates:
+        connection.execute('DELETE FROM daily_counts WHERE library = ? AND machine = ? AND date = ?', key + (date,))
+        connection.execute('INSERT OR IGNORE INTO machine_days VALUES (?, ?, ?)', key + (date,))
+    connection.executemany('INSERT INTO daily_counts VALUES (?, ?, ?, ?, ?)',
+                           [key + (date, error_type, count) for (date, error_type), count in day_counts.items()])
+    baselines = dict(connection.execute('SELECT error_type, last_date FROM baselines WHERE library = ? AND machine = ?', key).fetchall())
+    if any(last_date >= dates[0] for last_date in baselines.values()):
+        return True
+    return any(error_type not in baselines for _, error_type in day_counts if error_type not in anomaly_ignore_types)
+
+def walk_baselines(states, dates, day_counts):
+    """Go through the dates (sorted) for every error type of states: the count of the day is checked against the
+    baseline of the days before it, then added to it. states is {error type: [last date, days, mean, variance]} and
+    changed in place. Returns the anomalies as (date, error type, count, baseline, z-score)."""
+    alpha = 2 / (history_span_days + 1)
+    anomalies = []
+    for date in dates:
+        for error_type, state in states.items():
+            count = day_counts.get((date, error_type), 0)
+            _, days, mean, variance = state
+            if days >= anomaly_min_days and count >= anomaly_min_count:
+                #a standard deviation of at least one event, else any event after quiet days would be an anomaly
+                z_score = (count - mean) / max(math.sqrt(variance), 1.0)
+                if z_score >= anomaly_z:
+                    anomalies.append((date, error_type, count, round(mean, 2), round(z_score, 2)))
+            if days == 0:
+                mean, variance = float(count), 0.0
+            else:
+                difference = count - mean
+                mean += alpha * difference
+                variance = (1 - alpha) * (variance + alpha * difference * difference)
+            state[:] = [date, days + 1, mean, variance]
+    return anomalies
+
+def save_machine_baselines(connection, library, machine, states, anomalies):
+    key = (library, machine)
+    connection.executemany('INSERT OR REPLACE INTO baselines VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           [key + (error_type,) + tuple(state) for error_type, state in states.items()])
+    connection.executemany('INSERT OR REPLACE INTO anomalies VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           [key + anomaly for anomaly in anomalies])
+
+def update_machine_baselines(connection, library, machine, dates, day_counts):
+    """Walk only the new days of the machine (all after the last day of its baselines)."""
+    rows = connection.execute('SELECT error_type, last_date, days, mean, variance FROM baselines WHERE library = ? AND machine = ?',
+                              (library, machine)).fetchall()
+    states = {row[0]: list(row[1:]) for row in rows}
+    save_machine_baselines(connection, library, machine, states, walk_baselines(states, dates, day_counts))
+
+def rebuild_machine_baselines(connection, library, machine):
+    """Walk every stored day of the machine again, from empty baselines."""
+    key = (library, machine)
+    dates = [row[0] for row in connection.execute('SELECT date FROM machine_days WHERE library = ? AND machine = ? ORDER BY date', key)]
+    day_counts = {(date, error_type): count for date, error_type, count
+                  in connection.execute('SELECT date, error_type, count FROM daily_counts WHERE library = ? AND machine = ?', key)}
+    states = {error_type: [None, 0, 0.0, 0.0] for error_type in sorted({error_type for _, error_type in day_counts})
+              if error_type not in anomaly_ignore_types}
+    connection.execute('DELETE FROM baselines WHERE library = ? AND machine = ?', key)
+    connection.execute('DELETE FROM anomalies WHERE library = ? AND machine = ?', key)
+    save_machine_baselines(connection, library, machine, states, walk_baselines(states, dates, day_counts))
+
+def get_machine_anomalies(connection, library, machine, dates):
+    rows = connection.execute('SELECT library, machine, date, error_type, count, baseline, z_score FROM anomalies '
+                              'WHERE library = ? AND machine = ? AND date BETWEEN ? AND ?', (library, machine, dates[0], dates[-1])).fetchall()
+    dates = set(dates)
+    return [list(row) for row in rows if row[2] in dates]
+
+def write_anomaly_report(output_path, anomalies):
+    """Anomalies of a run without summary sheets go to <output>_anomalies.csv. Returns its path, None if there are none."""
+    if not anomalies:
+        return None
+    report_path = os.path.splitext(output_path.rstrip('/\\'))[0] + '_anomalies.csv'
+    with open(report_path, 'w', newline='', encoding='utf-8-sig') as report_file:
+        writer = csv.writer(report_file)
+        writer.writerow(anomaly_columns)
+        writer.writerows(anomalies)
+    return report_path
+
+def add_pending_abnormal_boots():
+    """Abnormal boots never explained by a remote restart are added at the end, the ones at hh:00-hh:02 are scheduled boots."""
     for machine in abnormal_boot_list:
         for date in abnormal_boot_list[machine]:
-            for abnormal_boot in abnormal_boot_list[machine][date]:
-                if abnormal_boot['Time'].minute < 3:
-                    abnormal_boot.update({"Error Type": "scheduled boot"})
-                    
-                abnormal_boot.update({"Time": abnormal_boot['Time'].time()})
-                all_local_error_logs.append(abnormal_boot)
-    local_error_df = pd.DataFrame(all_local_error_logs)
+            add_pending_day(abnormal_boot_list[machine][date])
+
+def add_pending_day(pending):
+    for abnormal_boot in pending:
+        if abnormal_boot['Time'] // 60 % 60 < 3:
+            abnormal_boot.update({"Error Type": "scheduled boot"})
+            
+        add_event(abnormal_boot)
+
+#--------------------------------shards------------------------------
+partial_format = 1  #bump when the partial files change shape
+
+def parse_shard(text):
+    """'2/4' -> (2, 4)"""
+    number, sep, count = text.partition('/')
+    if not sep or not number.isdecimal() or not count.isdecimal() or not 1 <= int(number) <= int(count):
+        raise ValueError(f'a shard is K/N with 1 <= K <= N, got {text}')
+    return int(number), int(count)
+
+def shard_of_zip(zip_path, count):
+    """Shard (1..count) of a zip, from the crc32 of its library or machine name: the same on every host and run."""
+    library, machine = machine_of_zip(zip_path)
+    return zlib.crc32((library if shard_by == 'library' else machine).encode('utf-8')) % count + 1
+
+def in_shard(zip_path):
+    return shard is None or shard_of_zip(zip_path, shard[1]) == shard[0]
+
+def shard_partial_path(output_path):
+    """<output>_shard2of4.json.gz next to the output, or the output itself when it already is a .json.gz."""
+    if output_path.endswith('.json.gz'):
+        return output_path
+    return os.path.splitext(output_path.rstrip('/\\'))[0] + f'_shard{shard[0]}of{shard[1]}.json.gz'
+
+class ShardPartial:
+    """Zip results of a shard run in a gzip json lines file, after a header telling which shard of which folder,
+    error types and date range they are, so merge_partials can check the partials go together. Results are kept as
+    process_zip gives them (boots not matched yet), with the place of the zip in the walk of the whole folder."""
+
+    def __init__(self, logs_folder, path):
+        self.logs_folder = os.path.abspath(logs_folder)
+        self.path = path
+        #walk of the whole folder, not only of the shard, so all the partials share one order
+        self.zip_order = {os.path.abspath(zip_path): order for order, zip_path in enumerate(find_zip_files(logs_folder))}
+        self.zips = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        #written under another name until the shard is done, a stopped shard leaves no partial to merge
+        self.file = gzip.open(path + '.tmp', 'wt', encoding='utf-8')
+        header = {
+            'partial': partial_format,
+            'shard': shard[0],
+            'shards': shard[1],
+            'shard_by': shard_by,
+            'folder': self.logs_folder,
+            'zip_count': len(self.zip_order),
+            'config': get_cache_config_hash(),
+            'error_types': [list(error_type) for error_type in get_error_matcher().error_types],
+            'rule_sets': get_error_matcher().rule_sets,
+            'start_date': start_date or default_start_date,
+            'end_date': end_date or default_end_date,
+            'dedup_logs': dedup_logs,
+            'host': platform.node(),
+            'created': datetime.datetime.now().isoformat(timespec='seconds')
+        }
+        self.file.write(json.dumps(header, ensure_ascii=False) + '\n')
+
+    def add(self, result):
+        zip_path = os.path.abspath(result['zip_path'])
+        entry = {
+            'order': self.zip_order.get(zip_path, len(self.zip_order)),
+            'zip': os.path.relpath(zip_path, self.logs_folder).replace('\\', '/'),
+            'result': json.loads(encode_zip_result(result))
+        }
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.zips += 1
+
+    def close(self, finished):
+        self.file.close()
+        if finished:
+            os.replace(self.path + '.tmp', self.path)
+        else:
+            os.remove(self.path + '.tmp')
+
+def finish_shard_run():
+    """End of a shard run: the partial is complete. Returns the number of zips in it."""
+    global shard_partial
+    partial, shard_partial = shard_partial, None
+    partial.close(finished=True)
+    close_journal(finished=True)
+    print('\033[94m' + f"shard {shard[0]}/{shard[1]} (by {shard_by}): {partial.zips} zips written to {partial.path}" + '\033[0m')
+    print('\033[94m' + f"number of machines per lib: {lib_machines_count}" + '\033[0m')
+    if invalid_zip or failed_zips:
+        print('\033[93m' + f"invalid zips: {len(invalid_zip)}, failed zips: {len(failed_zips)}, listed in the report of --merge" + '\033[0m')
+    write_run_metrics()
+    return partial.zips
+
+def read_partial_header(path):
+    """Header of a partial. ValueError for a file that is not one (not gzip, not json, no header)."""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as partial_file:
+            header = json.loads(partial_file.readline())
+    except FileNotFoundError:
+        raise
+    except (OSError, EOFError, ValueError) as error:
+        raise ValueError(f'{path} is not a partial: {error}') from error
+    if not isinstance(header, dict) or 'partial' not in header:
+        raise ValueError(f'{path} is not a partial: no partial header')
+    return header
+
+def read_partial_entries(path):
+    """Zip entries of a partial. ValueError when the file is cut short or damaged after its header."""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as partial_file:
+            partial_file.readline()
+            for line in partial_file:
+                entry = json.loads(line)
+                if not isinstance(entry, dict) or not {'order', 'zip', 'result'} <= entry.keys():
+                    raise ValueError(f'not a zip entry: {line[:80]}')
+                yield entry
+    except (OSError, EOFError, ValueError) as error:
+        raise ValueError(f'{path} is damaged: {error}') from error
+
+partial_header_keys = ('shard', 'shards', 'shard_by', 'folder', 'zip_count', 'config', 'error_types', 'start_date', 'end_date', 'dedup_logs')
+
+def check_partials(partial_paths, headers):
+    """Partials can only be merged when they are all the shards of one split of the same folder and settings."""
+    first = headers[0]
+    for path, header in zip(partial_paths, headers):
+        if header.get('partial') != partial_format:
+            raise ValueError(f'{path} is not a partial of this version (format {header.get("partial")}, expected {partial_format})')
+        absent = [key for key in partial_header_keys if key not in header]
+        if absent:
+            raise ValueError(f'{path} is not a partial: no {", ".join(absent)} in its header')
+        for key in ('shards', 'shard_by', 'zip_count', 'config', 'dedup_logs'):
+            if header[key] != first[key]:
+                raise ValueError(f'{path} has another {key} ({header[key]}) than {partial_paths[0]} ({first[key]})')
+    shards = collections.Counter(header['shard'] for header in headers)
+    doubled = sorted(number for number, count in shards.items() if count > 1)
+    missing = sorted(set(range(1, first['shards'] + 1)) - set(shards))
+    if doubled:
+        raise ValueError(f'shard(s) {doubled} given more than once')
+    if missing:
+        raise ValueError(f'shard(s) {missing} of {first["shards"]} missing')
+
+def merge_partials(partial_paths, output_excel):
+    """Output of the partials of every shard (--merge): their zip results go through boot matching, summary and
+    history in the walk order of the whole folder, so the output is the same whatever order the partials are given
+    in, and the same as one run over the folder. Returns the number of rows written."""
+    global start_date
+    global end_date
+    global error_matcher
+    global run_config
+    headers = [read_partial_header(path) for path in partial_paths]
+    if not headers:
+        raise ValueError('no partial to merge')
+    check_partials(partial_paths, headers)
+    first = headers[0]
+    #rule sets and dates of the shards, whatever the local settings say
+    rule_sets = first.get('rule_sets') or [rule_set_of_error_types(dict(first['error_types']))]
+    saved = (start_date, end_date, error_matcher, run_config)
+    start_date, end_date = first['start_date'], first['end_date']
+    error_matcher = ErrorMatcher(rule_sets=rule_sets)
+    run_config = RunConfig(first['folder'], output_excel, start_date, end_date, error_matcher.error_types, rule_sets)
+    try:
+        reset_run_state()
+        start_run_metrics()
+        kind = open_run_output(output_excel)
+        entries = heapq.merge(*(read_partial_entries(path) for path in partial_paths), key=lambda entry: (entry['order'], entry['zip']))
+        with timed_stage('merge'):
+            for entry in entries:
+                add_zip_result(entry['result'])
+        return write_run_output(output_excel, kind)
+    finally:
+        start_date, end_date, error_matcher, run_config = saved
+
+def open_run_output(output_excel):
+    """Summary, history and output stream of a run writing output_excel, as the settings ask. Returns the output kind."""
+    global output_stream
+    global run_summary
+    global run_history
+    # Ensure output directory exists
+    os.makedirs(os.path.dirname(output_excel) or '.', exist_ok=True)
     
-    # Reorder columns
-    if not local_error_df.empty:
-        error_cols = ['Library', 'Machine', 'Date', 'Time', 'Error Type']
-        local_error_df = local_error_df[error_cols]
+    kind = output_kind(output_excel)
+    if summary_sheets and kind == 'xlsx':
+        run_summary = RunSummary()
+    if update_history:
+        run_history = EventHistory()
+    if stream_excel or kind != 'xlsx':
+        output_stream = open_output_stream(output_excel)
+    return kind
+
+def extract_errors_to_single_excel(logs_folder='logs', output_excel='xlsx/error_logs.xlsx', log_filetype = 'local', workers=1):
+    """Extract specified error types from local logs in all zip files across subfolders and save to a single Excel file
+    (or to an indexed sqlite database / partitioned parquet folder when output_excel ends in .sqlite, .db or .parquet).
+    With shard set, only the zips of the shard are gone through, into a partial for merge_partials instead."""
     
-    # Ensure output directory exists
-    os.makedirs(os.path.dirname(output_excel), exist_ok=True)
+    global shard_partial
+    reset_run_state()
+    start_run_metrics()
+    get_error_matcher()     #compile error types once for the whole run
     
-    # Save to Excel
-    with pd.ExcelWriter(output_excel, engine='xlsxwriter') as writer:
-        if not local_error_df.empty:
-            local_error_df.to_excel(writer, sheet_name='Error_Logs', index=False)
+    if shard is not None:
+        shard_partial = ShardPartial(logs_folder, shard_partial_path(output_excel))
+    else:
+        kind = open_run_output(output_excel)
+    with timed_stage('cache_open'):
+        open_zip_cache()
+    open_journal(logs_folder)
+    walked = False
+    try:
+        with timed_stage('walk'):
+            if workers > 1:
+                parallel_walk_for_zip(logs_folder, workers)
+            elif prefetch_threads > 0:
+                prefetch_walk_for_zip(logs_folder, prefetch_threads)
+            else:
+                recursive_walk_for_zip(logs_folder, log_filetype)
+        walked = True
+    finally:
+        close_chunk_pool()
+        with timed_stage('cache_close'):
+            close_zip_cache()
+        if not walked:
+            close_journal(finished=False)
+            if shard_partial is not None:
+                shard_partial.close(finished=False)
+                shard_partial = None
+    if shard_partial is not None:
+        return finish_shard_run()
+    return write_run_output(output_excel, kind)
+
+def write_run_output(output_excel, kind):
+    """End of a run once every zip result is added: last boot labels, history, the output itself and the run report.
+    Returns the number of rows written."""
+    global output_stream
+    # print(all_local_error_logs)
+    with timed_stage('pending_boots'):
+        add_pending_abnormal_boots()
+    anomalies = []
+    if run_history is not None:
+        with timed_stage('history'):
+            anomalies = run_history.save()
+    
+    with timed_stage('excel_write'):
+        summary = run_summary.sheets([error_type for error_type, _ in get_error_matcher().error_types], lib_machines_count) if run_summary is not None else []
+        if run_history is not None and run_summary is not None:
+            summary.append(('Anomalies', anomaly_columns, anomalies))
+        if output_stream is not None:
+            output_stream.write_rows(all_local_error_logs.iter_rows())
+            all_local_error_logs.clear()
+            for sheet_name, columns, rows in summary:
+                output_stream.write_sheet(sheet_name, columns, rows)
+            output_stream.close()
+            rows_written = output_stream.rows_written
+            if kind == 'xlsx':
+                print(f"rows written: {output_stream.rows_written} in {output_stream.sheet_count} sheet(s)")
+            else:
+                print(f"rows written: {output_stream.rows_written}")
+            output_stream = None
+        else:
+            # Create DataFrame (columns already in error_cols order)
+            local_error_df = all_local_error_logs.to_dataframe()
+            rows_written = len(local_error_df)
+            
+            # Save to Excel
+            import pandas as pd
+            with pd.ExcelWriter(output_excel, engine='xlsxwriter') as writer:
+                if not local_error_df.empty:
+                    local_error_df.to_excel(writer, sheet_name='Error_Logs', index=False)
+                for sheet_name, columns, rows in summary:
+                    pd.DataFrame(rows, columns=columns).to_excel(writer, sheet_name=sheet_name, index=False)
             
             
-    print(f"Excel file created successfully: {output_excel}" + '\033[0m')
+    label = 'Excel file' if kind == 'xlsx' else f'{kind} output'
+    print(f"{label} created successfully: {output_excel}" + '\033[0m')
     print('\033[94m' + f"number of machines per lib: {lib_machines_count}" + '\033[0m')
+    if use_cache:
+        print('\033[94m' + f"zips loaded from cache: {cache_hits}, zips skipped (no log in date range): {date_index_skips}" + '\033[0m')
+    if resume_run:
+        print('\033[94m' + f"zips resumed from the journal: {journal_hits}" + '\033[0m')
+    report_path = write_failure_report(output_excel)
+    if report_path:
+        print('\033[93m' + f"invalid zips: {len(invalid_zip)}, failed zips: {len(failed_zips)}, listed in {report_path}" + '\033[0m')
+    close_journal(finished=True)
+    if dedup_logs:
+        print('\033[94m' + f"duplicate log files skipped (already in another zip of the same machine): {duplicate_logs_skipped}" + '\033[0m')
+    if run_history is not None:
+        anomaly_report = write_anomaly_report(output_excel, anomalies) if run_summary is None else None
+        print('\033[94m' + f"anomalies (days far above the machine baseline, history in {history_location}): {len(anomalies)}" +
+              (f", listed in {anomaly_report}" if anomaly_report else '') + '\033[0m')
+    write_run_metrics()
+    return rows_written
+
+AnalyzeResult = collections.namedtuple('AnalyzeResult', ['output', 'rows', 'machines', 'invalid_zips', 'cache_hits', 'zips_skipped', 'duplicate_logs', 'failed_zips', 'anomalies', 'seconds'])
+batch_matchers = {}     #compiled rule sets of earlier analyze() calls, by rule_sets_key
+
+def analyze(folder=None, out=None, start=None, end=None, error_types=None, workers=1, config=None, verbose=True, rule_sets=None):
+    """Headless run for scripts and schedulers: no menu, no settings written, and settings / error types read once
+    into a RunConfig (or given as config, to reuse one snapshot for many runs). Same output as the menu 'run'.
+    verbose=False keeps the progress prints of this process quiet. Returns an AnalyzeResult."""
+    global direct_run
+    global start_date
+    global end_date
+    global error_matcher
+    global run_config
+    if config is None:
+        config = load_config(folder, out, start, end, error_types, rule_sets)
+    saved = (direct_run, start_date, end_date, error_matcher, run_config)
+    direct_run = True
+    start_date, end_date = config.start_date, config.end_date
+    key = rule_sets_key(config.rule_sets)
+    if key not in batch_matchers:
+        batch_matchers[key] = ErrorMatcher(rule_sets=config.rule_sets)
+    error_matcher = batch_matchers[key]
+    run_config = config
+    started = time_module.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) if not verbose else contextlib.nullcontext():
+            rows = extract_errors_to_single_excel(config.folder, config.output, workers=workers)
+    finally:
+        direct_run, start_date, end_date, error_matcher, run_config = saved
+    return AnalyzeResult(
+        output=config.output,
+        rows=rows,
+        machines=dict(lib_machines_count),
+        invalid_zips=list(invalid_zip),
+        cache_hits=cache_hits,
+        zips_skipped=date_index_skips,
+        duplicate_logs=duplicate_logs_skipped,
+        failed_zips=list(failed_zips),
+        anomalies=list(run_history.anomalies) if run_history is not None else [],
+        seconds=time_module.perf_counter() - started
+    )
     
 def datetime_check(date_type):
     if date_type == 'start':
@@ -411,6 +2944,132 @@ if __name__ == "__main__":
         '-o',
         help='select output filepath'
     )
+    parser.add_argument(
+        '--workers',
+        '-w',
+        type=int,
+        default=1,
+        help='number of processes used to go through the zip files (default 1 = no multiprocessing)'
+    )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        metavar='THREADS',
+        help='read the next zips into memory with THREADS threads while parsing (for slow / OneDrive folders, without --workers)'
+    )
+    parser.add_argument(
+        '--prefetch-budget-mb',
+        type=int,
+        help=f'most MB of zips held in memory by --prefetch (default {prefetch_budget_mb})'
+    )
+    parser.add_argument(
+        '--chunk-workers',
+        type=int,
+        metavar='N',
+        help='match log files bigger than --chunk-threshold-mb in pieces with N processes (per --workers process)'
+    )
+    parser.add_argument(
+        '--chunk-threshold-mb',
+        type=int,
+        help=f'size from which a log file is matched in pieces by --chunk-workers (default {chunk_threshold_mb})'
+    )
+    parser.add_argument(
+        '--memory-budget-mb',
+        type=int,
+        help=f'MB of zips that --workers may process at once, estimated from their central directory (default {memory_budget_mb})'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='write rows to the excel file while going through the zips (flat memory, new sheet every 1048576 rows)'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help=f'go on from the zips done by a run that crashed or was stopped (journal in {journal_location})'
+    )
+    parser.add_argument(
+        '--no-dedup',
+        action='store_true',
+        help='parse every copy of a log file found in several zips of the same machine (e.g. two export folders)'
+    )
+    parser.add_argument(
+        '--no-summary',
+        action='store_true',
+        help='only the Error_Logs sheet, without the summary sheets (library x error type, machine x day, boot rates, machines)'
+    )
+    parser.add_argument(
+        '--no-raw-rows',
+        action='store_true',
+        help='only the summary sheets, without the Error_Logs rows (for runs with too many rows for excel)'
+    )
+    parser.add_argument(
+        '--shard',
+        type=parse_shard,
+        metavar='K/N',
+        help='go through shard K of N of the input folder only (one per host) and write a partial <output>_shardKofN.json.gz for --merge'
+    )
+    parser.add_argument(
+        '--shard-by',
+        choices=['library', 'machine'],
+        help=f'split the zips between the shards by library or by a hash of the machine name (default {shard_by})'
+    )
+    parser.add_argument(
+        '--merge',
+        nargs='+',
+        metavar='PARTIAL',
+        help='write -o from the partials of all the --shard runs (any order) instead of going through the zips'
+    )
+    parser.add_argument(
+        '--rules',
+        nargs='+',
+        metavar='RULE_SET',
+        help='match with these rule set json files instead of error_types.json, all in one pass (roles come from the first)'
+    )
+    parser.add_argument(
+        '--check-rules',
+        action='store_true',
+        help='validate the rule sets (--rules, else error_types.json), print them and exit'
+    )
+    parser.add_argument(
+        '--no-history',
+        action='store_true',
+        help=f'do not add the run to the event history ({history_location}) nor write the Anomalies sheet'
+    )
+    parser.add_argument(
+        '--metrics-out',
+        help='write run metrics (time per stage / zip / log file, bytes, lines, matches, slowest zips) to this json file'
+    )
+    parser.add_argument(
+        '--trace-out',
+        help='write a chrome trace (chrome://tracing, ui.perfetto.dev) of the zips and log files to this json file'
+    )
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const='',
+        metavar='PROF_FILE',
+        help='run under cProfile and print the slowest functions, optionally saving the stats to PROF_FILE'
+    )
+    parser.add_argument(
+        '--follow',
+        action='store_true',
+        help='keep watching the input folder (unzipped Log folders) and write new events to --sink as they are logged'
+    )
+    parser.add_argument(
+        '--sink',
+        help='output of --follow: .csv, .jsonl or .sqlite file (default live/events.csv)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='parse every zip again without reading or writing the zip cache'
+    )
+    parser.add_argument(
+        '--rebuild-cache',
+        action='store_true',
+        help='empty the zip cache and parse every zip again'
+    )
 
     # Parse the arguments
     args = parser.parse_args()
@@ -418,6 +3077,43 @@ if __name__ == "__main__":
     # Access the arguments
     input_path = args.input
     output_path = args.output
+    workers = args.workers
+    if args.no_cache:
+        use_cache = False
+    if args.stream:
+        stream_excel = True
+    if args.prefetch:
+        prefetch_threads = args.prefetch
+    if args.prefetch_budget_mb:
+        prefetch_budget_mb = args.prefetch_budget_mb
+    if args.resume:
+        resume_run = True
+    if args.no_dedup:
+        dedup_logs = False
+    if args.no_summary:
+        summary_sheets = False
+    if args.no_raw_rows:
+        raw_rows = False
+    if args.no_history:
+        update_history = False
+    if args.shard:
+        shard = args.shard
+        #shards on one host must not share the journal
+        journal_location = os.path.splitext(journal_location)[0] + f'_shard{shard[0]}of{shard[1]}.jsonl'
+    if args.shard_by:
+        shard_by = args.shard_by
+    if args.rules:
+        rule_set_paths = args.rules
+    if args.chunk_workers:
+        chunk_workers = args.chunk_workers
+    if args.chunk_threshold_mb:
+        chunk_threshold_mb = args.chunk_threshold_mb
+    if args.memory_budget_mb:
+        memory_budget_mb = args.memory_budget_mb
+    metrics_out = args.metrics_out
+    trace_out = args.trace_out
+    if args.rebuild_cache:
+        rebuild_cache = True
     
     
 
@@ -427,6 +3123,20 @@ if __name__ == "__main__":
         output_excel_location = re.sub('<date>', today.strftime('%d-%m-%Y'), output_path)
     if input_path and output_path:
         direct_run = True
+    if args.follow:
+        direct_run = True
+    if args.merge:
+        if not output_path:
+            parser.error('--merge needs the output file (-o)')
+        direct_run = True
+    if args.check_rules:
+        try:
+            matcher = get_error_matcher()
+        except (ValueError, FileNotFoundError) as error:
+            print('\033[91m' + f'Failure: {error}' + '\033[0m')
+            sys.exit(1)
+        print_rule_sets(matcher)
+        sys.exit(0)
     
     # -----------------------Change default settings to user customized setting----------------------
     settings = get_settings_json()
@@ -566,8 +3276,8 @@ if __name__ == "__main__":
                 continue
             if reply == 'run':
                 break
-            if not re.search('.xlsx$', reply):
-                terminal_response = '\033[91m' + 'Failure: Cannot change export filepath / filename: \n\tIncompatible filename: please end with a .xlsx' + '\033[0m'
+            if not re.search(r'\.(xlsx|sqlite|db|parquet)$', reply):
+                terminal_response = '\033[91m' + 'Failure: Cannot change export filepath / filename: \n\tIncompatible filename: please end with a .xlsx (or .sqlite / .db / .parquet)' + '\033[0m'
                 continue
             change_settings_json("output_excel_location", reply)
             output_excel_location = re.sub('<date>', today.strftime('%d-%m-%Y'), reply)
@@ -579,10 +3289,12 @@ if __name__ == "__main__":
             data = get_error_json()
             for error in data:
                 print('\033[94m' + error + ': ' + data[error] + '\033[96m')
+            if rule_set_paths:
+                print('\033[93m' + 'Warning: this run matches with the rule sets ' + ', '.join(rule_set_paths) + ', not with these error types' + '\033[96m')
             reply = input(
                           'Commands:\n' +
                           '\tTo reset to default, please type \'default\'\n' + 
-                          '\tTo add error type, please type \'add <key> <error message>\', where error message do not contain any space\n' +
+                          '\tTo add error type, please type \'add <key> <error message>\', where the error message (spaces allowed) is a regex\n' +
                           '\tTo remove error type, please type \'remove <key>\'\n' +
                           '\tTo go back, please type \'back\'\n' + 
                           '\tTo run the program, please type \'run\' \n' + '\033[0m')
@@ -595,10 +3307,20 @@ if __name__ == "__main__":
                 terminal_response = '\033[92m' + 'error types are set to default' + '\033[0m'
                 continue
             if reply.startswith('add'):
-                words = re.split(r"\s", reply)
+                words = reply.split(maxsplit=2)
+                if len(words) < 3:
+                    terminal_response = '\033[91m' + 'Failure: Cannot add error type: \n\tplease type \'add <key> <error message>\'' + '\033[0m'
+                    continue
                 key = words[1]
                 content = words[2]
-                add_error_json(key, content)
+                try:
+                    validate_rule_set(rule_set_of_error_types({key: content}))
+                except ValueError as error:
+                    terminal_response = '\033[91m' + f'Failure: Cannot add error type: \n\t{error}' + '\033[0m'
+                    continue
+                if not add_error_json(key, content):
+                    terminal_response = '\033[91m' + f'Failure: Cannot add error type: \n\t{key} already exists, remove it first' + '\033[0m'
+                    continue
                 terminal_response = '\033[92m' + 'error type successfully added' + '\033[0m'
                 continue
             if reply.startswith('remove'):
@@ -639,4 +3361,22 @@ if __name__ == "__main__":
             continue
             
         
-    extract_errors_to_single_excel(logs_folder=folderpath, output_excel = output_excel_location)
\ No newline at end of file
+    if not args.merge:
+        #rule sets that do not validate end the run here, --merge takes the rule sets of the partials
+        try:
+            get_error_matcher()
+        except (ValueError, FileNotFoundError) as error:
+            print('\033[91m' + f'Failure: {error}' + '\033[0m')
+            sys.exit(1)
+    if args.follow:
+        follow_logs(folderpath, args.sink or follow_sink)
+    elif args.merge:
+        try:
+            merge_partials(args.merge, output_excel_location)
+        except (ValueError, FileNotFoundError) as error:
+            print('\033[91m' + f'Failure: {error}' + '\033[0m')
+            sys.exit(1)
+    elif args.profile is not None:
+        profile_run(extract_errors_to_single_excel, args.profile, logs_folder=folderpath, output_excel = output_excel_location, workers = workers)
+    else:
+        extract_errors_to_single_excel(logs_folder=folderpath, output_excel = output_excel_location, workers = workers)
\ No newline at end of file
@@ -0,0 +1,279 @@
+"""Benchmarks for Error_log_to_excel.py
+
+usage:
+    python bench.py parser [--lines 1000000]     lines/sec of the old and the new line parser on a synthetic log
+    python bench.py prefilter [--lines 1000000]  decoding every line + regex vs the bytes level literal search
+    python bench.py corpus <folder> [--scale 1]  write a synthetic logs folder (libraries of LIB-MACHINE.zip files)
+    python bench.py run [--corpus <folder>] [--scale 1] [--out result.json] [--baseline baseline.json]
+                                                 time every stage of a run and the whole run, printed as json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import zipfile
+
+import pandas as pd
+
+import Error_log_to_excel as analyzer
+
+
+def synthetic_log_lines(count, error_rate=0.01, seed=0):
+    """Lines looking like a real machine log, error_rate of them containing one of the default error types."""
+    rng = random.Random(seed)
+    messages = list(analyzer.default_error_types.values())
+    lines = []
+    seconds = 0
+    for _ in range(count):
+        seconds = (seconds + rng.randint(0, 3)) % (24*60*60)
+        if rng.random() < error_rate:
+            message = '[INFO] ' + rng.choice(messages)
+        else:
+            message = '[INFO] 正在刷新页面状态, request id=' + str(rng.randint(0, 10**9))
+        lines.append(f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}.{rng.randint(0, 999):03d} {message}\n')
+    return lines
+
+
+def legacy_process_lines(lines, error_types):
+    """The line loop before the fast path: parse_log_line + strptime on every line, then one re.search per error type."""
+    data = []
+    for line in lines:
+        parsed = analyzer.parse_log_line(line)
+        if parsed:
+            parsed['Time'] = datetime.datetime.strptime(parsed['Time'], '%H:%M:%S')
+            for error in error_types:
+                if re.search(error_types[error], line):
+                    parsed['Error Type'] = error
+                    data.append(parsed)
+                    break
+    return data
+
+
+def make_corpus(folder, scale=1, seed=0):
+    """Synthetic logs folder laid out like the real export: <export date>/<library>/<LIB-MACHINE>.zip with
+    Log/<yyyy-mm-dd>_local.log files and a command.log, plus a zip with the machine zip nested inside it
+    and a corrupt zip in every library. scale = number of libraries."""
+    rng = random.Random(seed)
+    first_day = datetime.date(2025, 6, 6)
+    for library_number in range(max(1, int(scale))):
+        library = f'LIB{library_number}'
+        library_folder = os.path.join(folder, '23.7.2025', library)
+        os.makedirs(library_folder, exist_ok=True)
+        for machine_number in range(5):
+            machine = f'{library}-GFK-PAK{machine_number}'
+            zip_buffer = io.BytesIO()
+            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+                for day in range(7):
+                    date_str = (first_day + datetime.timedelta(days=day)).isoformat()
+                    zip_ref.writestr(f'Log/{date_str}_local.log', ''.join(synthetic_log_lines(5000, seed=rng.random())))
+                zip_ref.writestr('Log/command.log', ''.join(synthetic_log_lines(500, seed=rng.random())))
+            if machine_number == 0:
+                #some exports have the machine zip inside another zip
+                nested_buffer = io.BytesIO()
+                with zipfile.ZipFile(nested_buffer, 'w') as zip_ref:
+                    zip_ref.writestr(f'export/{machine}.zip', zip_buffer.getvalue())
+                zip_buffer = nested_buffer
+            with open(os.path.join(library_folder, machine + '.zip'), 'wb') as f:
+                f.write(zip_buffer.getvalue())
+        with open(os.path.join(library_folder, f'{library}-BROKEN.zip'), 'wb') as f:
+            f.write(b'PK\x03\x04 not really a zip')
+
+
+def read_zip_logs(zip_path, zip_file, files):
+    """Decompression stage: read the logs a run would read into memory, as (zip_path, library, machine, date, bytes)."""
+    library, machine = analyzer.machine_of_zip(zip_path)
+    try:
+        with zipfile.ZipFile(zip_file or zip_path) as zip_ref:
+            logs, members = analyzer.select_log_members(zip_ref)
+            if logs is None:
+                for info in members:
+                    if info.filename.endswith('.zip'):
+                        read_zip_logs(os.path.join(zip_path, info.filename), io.BytesIO(zip_ref.read(info)), files)
+                return
+            for info, date_str in logs:
+                files.append((zip_path, library, machine, date_str, zip_ref.read(info)))
+    except zipfile.BadZipFile:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:     #not there on windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+
+def stage_result(seconds, mb=None, lines=None):
+    result = {'seconds': round(seconds, 4)}
+    if mb is not None:
+        result['mb_per_s'] = round(mb / seconds, 2) if seconds else None
+    if lines is not None:
+        result['lines_per_s'] = round(lines / seconds) if seconds else None
+    return result
+
+
+def bench_run(folder, output_folder):
+    """Time discovery, decompression, parse, classify, boot resolution and excel write one after another,
+    then the whole run as the script does it."""
+    analyzer.direct_run = True
+    analyzer.use_cache = False
+    analyzer.update_history = False     #the synthetic machines must not end up in the real event history
+    analyzer.start_date = 'none'
+    analyzer.end_date = 'none'
+    analyzer.error_matcher = analyzer.ErrorMatcher(dict(analyzer.default_error_types))
+    analyzer.reset_run_state()
+    stages = {}
+
+    start = time.perf_counter()
+    zip_paths = analyzer.find_zip_files(folder)
+    stages['discovery'] = stage_result(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    files = []
+    for zip_path in zip_paths:
+        read_zip_logs(zip_path, None, files)
+    mb = sum(len(data) for *_, data in files) / 1024**2
+    stages['decompression'] = stage_result(time.perf_counter() - start, mb=mb)
+
+    start = time.perf_counter()
+    texts = [(zip_path, library, machine, date_str, data.decode('utf-8', errors='ignore').splitlines(keepends=True))
+             for zip_path, library, machine, date_str, data in files]
+    lines = sum(len(text) for *_, text in texts)
+    stages['parse'] = stage_result(time.perf_counter() - start, mb=mb, lines=lines)
+
+    start = time.perf_counter()
+    zip_results = {}
+    for zip_path, library, machine, date_str, text in texts:
+        zip_results.setdefault(zip_path, []).extend(analyzer.process_log_lines(text, date_str, library, machine))
+    stages['classify'] = stage_result(time.perf_counter() - start, mb=mb, lines=lines)
+
+    start = time.perf_counter()
+    for log_data in zip_results.values():
+        analyzer.add_log_data(log_data)
+    analyzer.add_pending_abnormal_boots()
+    stages['boot_resolution'] = stage_result(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    df = analyzer.all_local_error_logs.to_dataframe()
+    with pd.ExcelWriter(os.path.join(output_folder, 'stages.xlsx'), engine='xlsxwriter') as writer:
+        df.to_excel(writer, sheet_name='Error_Logs', index=False)
+    stages['excel_write'] = stage_result(time.perf_counter() - start)
+    rows = len(df)
+    del df, texts, files, zip_results
+
+    start = time.perf_counter()
+    #keep stdout for the json
+    with contextlib.redirect_stdout(sys.stderr):
+        analyzer.extract_errors_to_single_excel(logs_folder=folder, output_excel=os.path.join(output_folder, 'run.xlsx'))
+    end_to_end = stage_result(time.perf_counter() - start, mb=mb, lines=lines)
+
+    return {
+        'corpus': {'folder': folder, 'zips': len(zip_paths), 'mb': round(mb, 2), 'lines': lines, 'rows': rows},
+        'stages': stages,
+        'end_to_end': end_to_end,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def compare_with_baseline(result, baseline_path):
+    """Add 'baseline' to the result: seconds now / seconds in the baseline, per stage (< 1 is faster)."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    ratio = {}
+    for stage, timing in list(result['stages'].items()) + [('end_to_end', result['end_to_end'])]:
+        before = baseline['end_to_end'] if stage == 'end_to_end' else baseline['stages'].get(stage)
+        if before and before['seconds']:
+            ratio[stage] = round(timing['seconds'] / before['seconds'], 3)
+    result['baseline'] = {'file': baseline_path, 'time_ratio': ratio}
+
+
+def bench_parser(line_count):
+    lines = synthetic_log_lines(line_count)
+    error_types = dict(analyzer.default_error_types)
+    analyzer.error_matcher = analyzer.ErrorMatcher(error_types)
+
+    start = time.perf_counter()
+    before = legacy_process_lines(lines, error_types)
+    before_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    after = analyzer.process_log_lines(lines, '2025-01-01', 'LIB', 'LIB-MACHINE')
+    after_seconds = time.perf_counter() - start
+
+    #boot rows are renamed by the boot check and the message is not kept, so only compare times
+    same_rows = [row['Time'].strftime('%H:%M:%S') for row in before] == \
+                [str(analyzer.seconds_to_time(row['Time'])) for row in after]
+    print(f'lines: {line_count}, matched: {len(after)}, same rows: {same_rows}')
+    print(f'before: {line_count / before_seconds:,.0f} lines/s ({before_seconds:.2f}s)')
+    print(f'after:  {line_count / after_seconds:,.0f} lines/s ({after_seconds:.2f}s)')
+    print(f'speedup: {before_seconds / after_seconds:.1f}x')
+
+
+def bench_prefilter(line_count, error_rate):
+    """A log file as bytes, classified the text way (decode every line, regex reject) and the bytes way
+    (process_log_stream: literal search on the raw bytes, only hits decoded)."""
+    data = ''.join(synthetic_log_lines(line_count, error_rate=error_rate)).encode('utf-8')
+    analyzer.error_matcher = analyzer.ErrorMatcher(dict(analyzer.default_error_types))
+    mb = len(data) / 1024**2
+
+    start = time.perf_counter()
+    with io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='ignore') as f:
+        before = analyzer.process_log_lines(f, '2025-01-01', 'LIB', 'LIB-MACHINE')
+    before_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    after = analyzer.process_log_stream(io.BytesIO(data), '2025-01-01', 'LIB', 'LIB-MACHINE')
+    after_seconds = time.perf_counter() - start
+
+    print(f'lines: {line_count} ({mb:.1f} MB), error rate: {error_rate}, matched: {len(after)}, same rows: {before == after}')
+    print(f'decode + regex:  {mb / before_seconds:,.1f} MB/s, {line_count / before_seconds:,.0f} lines/s ({before_seconds:.2f}s)')
+    print(f'bytes prefilter: {mb / after_seconds:,.1f} MB/s, {line_count / after_seconds:,.0f} lines/s ({after_seconds:.2f}s)')
+    print(f'speedup: {before_seconds / after_seconds:.1f}x')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the log analyzer.")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    parser_bench = subparsers.add_parser('parser', help='old vs fast line parser on a synthetic log')
+    parser_bench.add_argument('--lines', type=int, default=1000000, help='number of synthetic log lines')
+    parser_prefilter = subparsers.add_parser('prefilter', help='decode + regex vs bytes level literal search on a synthetic log')
+    parser_prefilter.add_argument('--lines', type=int, default=1000000, help='number of synthetic log lines')
+    parser_prefilter.add_argument('--error-rate', type=float, default=0.01, help='share of lines with an error type')
+    parser_corpus = subparsers.add_parser('corpus', help='write a synthetic logs folder')
+    parser_corpus.add_argument('folder', help='folder to write the libraries into')
+    parser_corpus.add_argument('--scale', type=int, default=1, help='number of libraries (5 machines x 7 days x 5000 lines each)')
+    parser_run = subparsers.add_parser('run', help='time every stage of a run')
+    parser_run.add_argument('--corpus', help='logs folder to use (default: a synthetic corpus in a temp folder)')
+    parser_run.add_argument('--scale', type=int, default=1, help='size of the synthetic corpus (number of libraries)')
+    parser_run.add_argument('--out', help='write the json result to this file (e.g. to use it as a baseline later)')
+    parser_run.add_argument('--baseline', help='json result of an earlier run to compare with')
+    args = parser.parse_args()
+
+    if args.benchmark == 'parser':
+        bench_parser(args.lines)
+    elif args.benchmark == 'prefilter':
+        bench_prefilter(args.lines, args.error_rate)
+    elif args.benchmark == 'corpus':
+        make_corpus(args.folder, args.scale)
+    elif args.benchmark == 'run':
+        with tempfile.TemporaryDirectory() as temp_dir:
+            folder = args.corpus
+            if not folder:
+                folder = os.path.join(temp_dir, 'logs')
+                make_corpus(folder, args.scale)
+            result = bench_run(folder, temp_dir)
+        if args.baseline:
+            compare_with_baseline(result, args.baseline)
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=4)
+        print(json.dumps(result, indent=4))
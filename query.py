@@ -0,0 +1,143 @@
+"""Questions on a run written to .sqlite / .db or .parquet (python Error_log_to_excel.py -o <file>.sqlite), without
+going through the zips or opening an xlsx again.
+
+usage:
+    python query.py <output> [--by library week] [--where error_type=A1,A2] [--from 2025-06-01] [--to 2025-06-30]
+                             [--rows] [--limit N] [--csv result.csv]
+    e.g. A1 events per library per week:
+    python query.py xlsx/events.sqlite --by library week --where error_type=A1
+
+--by takes the columns library, machine, date, time, error_type and the periods week (monday of the week) and month.
+Without --by the matching events are counted, with --rows they are listed.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+from Error_log_to_excel import store_columns, output_kind
+
+periods = ('week', 'month')
+
+
+def check_columns(columns):
+    for column in columns:
+        if column not in store_columns + periods:
+            raise ValueError(f'unknown column {column}, use one of {", ".join(store_columns + periods)}')
+
+
+def sqlite_query(path, by, where, date_from, date_to, rows, limit):
+    """One sql query on the events table: the indexes on (library|machine|error_type, date) cover the filters."""
+    expressions = {'week': "date(date, 'weekday 0', '-6 days')", 'month': 'substr(date, 1, 7)'}
+    conditions = []
+    parameters = []
+    for column, values in where.items():
+        conditions.append(f'{column} IN ({", ".join("?" * len(values))})')
+        parameters.extend(values)
+    if date_from:
+        conditions.append('date >= ?')
+        parameters.append(date_from)
+    if date_to:
+        conditions.append('date <= ?')
+        parameters.append(date_to)
+    sql_where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+    if rows:
+        sql = f'SELECT {", ".join(store_columns)} FROM events{sql_where} ORDER BY date, time'
+    else:
+        selected = [f'{expressions.get(column, column)} AS {column}' for column in by]
+        sql = f'SELECT {", ".join(selected + ["COUNT(*) AS count"])} FROM events{sql_where}'
+        if by:
+            sql += f' GROUP BY {", ".join(by)} ORDER BY {", ".join(by)}'
+    if limit:
+        sql += f' LIMIT {int(limit)}'
+    with sqlite3.connect(f'file:{path}?mode=ro', uri=True) as connection:
+        return pd.read_sql_query(sql, connection, params=parameters)
+
+
+def parquet_query(path, by, where, date_from, date_to, rows, limit):
+    """Filters go to pyarrow, so only the library=/date= folders asked for are read, then pandas does the grouping."""
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError:
+        raise ImportError('reading a parquet output needs pyarrow (pip install pyarrow)')
+    #partition values kept as text, else the dates would be guessed as something else
+    partitioning = pyarrow.dataset.partitioning(pyarrow.schema([('library', pyarrow.string()), ('date', pyarrow.string())]), flavor='hive')
+    dataset = pyarrow.dataset.dataset(path, format='parquet', partitioning=partitioning)
+    field = pyarrow.dataset.field
+    conditions = [field(column).isin(values) for column, values in where.items()]
+    if date_from:
+        conditions.append(field('date') >= date_from)
+    if date_to:
+        conditions.append(field('date') <= date_to)
+    condition = None
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+    df = dataset.to_table(filter=condition).to_pandas()[list(store_columns)]
+    if rows:
+        df = df.sort_values(['date', 'time'], kind='stable').reset_index(drop=True)
+    else:
+        if 'week' in by:
+            dates = pd.to_datetime(df['date'])
+            df['week'] = (dates - pd.to_timedelta(dates.dt.weekday, unit='D')).dt.strftime('%Y-%m-%d')
+        if 'month' in by:
+            df['month'] = df['date'].str[:7]
+        if by:
+            df = df.groupby(list(by)).size().reset_index(name='count')
+        else:
+            df = pd.DataFrame({'count': [len(df)]})
+    return df.head(limit) if limit else df
+
+
+def query_events(path, by=(), where=None, date_from=None, date_to=None, rows=False, limit=None):
+    """Counts of the events of an output, grouped by the `by` columns, or the events themselves with rows=True.
+    where is {column: [values]}, date_from / date_to are yyyy-mm-dd (included). Returns a DataFrame."""
+    where = {column: list(values) for column, values in (where or {}).items()}
+    check_columns(list(by) + list(where))
+    if set(where) & set(periods):
+        raise ValueError('week / month can only be used in by, filter the dates with date_from / date_to')
+    kind = output_kind(path)
+    if kind == 'sqlite':
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return sqlite_query(path, list(by), where, date_from, date_to, rows, limit)
+    if kind == 'parquet':
+        if not os.path.isdir(path):
+            raise FileNotFoundError(path)
+        return parquet_query(path, list(by), where, date_from, date_to, rows, limit)
+    raise ValueError(f'{path} is not a .sqlite / .db / .parquet output')
+
+
+def parse_where(conditions):
+    """['error_type=A1,A2', 'library=LIB0'] -> {'error_type': ['A1', 'A2'], 'library': ['LIB0']}"""
+    where = {}
+    for condition in conditions:
+        column, sep, values = condition.partition('=')
+        if not sep:
+            raise ValueError(f'--where needs column=value[,value...], got {condition}')
+        where.setdefault(column.strip(), []).extend(value.strip() for value in values.split(','))
+    return where
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grouped counts and filters on a .sqlite / .parquet output of the log analyzer.")
+    parser.add_argument('output', help='.sqlite / .db file or .parquet folder written by Error_log_to_excel.py -o')
+    parser.add_argument('--by', nargs='+', default=[], help=f'group the counts by these columns ({", ".join(store_columns + periods)})')
+    parser.add_argument('--where', nargs='+', default=[], metavar='COLUMN=VALUES', help='keep events where the column is one of the comma separated values')
+    parser.add_argument('--from', dest='date_from', help='first date (yyyy-mm-dd)')
+    parser.add_argument('--to', dest='date_to', help='last date (yyyy-mm-dd)')
+    parser.add_argument('--rows', action='store_true', help='list the events instead of counting them')
+    parser.add_argument('--limit', type=int, help='show at most this many lines')
+    parser.add_argument('--csv', help='also write the result to this csv file')
+    args = parser.parse_args()
+
+    try:
+        result = query_events(args.output, args.by, parse_where(args.where), args.date_from, args.date_to, args.rows, args.limit)
+    except (ValueError, FileNotFoundError, ImportError) as error:
+        print('\033[91m' + f'Failure: {error}' + '\033[0m')
+        sys.exit(1)
+    if args.csv:
+        result.to_csv(args.csv, index=False, encoding='utf-8-sig')
+    print(result.to_string(index=False))
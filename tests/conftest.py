@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench
+import Error_log_to_excel as analyzer
+
+
+@pytest.fixture(autouse=True)
+def run_settings(tmp_path, monkeypatch):
+    """Caches, journal, history and compiled rule sets go to a temp folder, and every test starts without a matcher
+    or run config."""
+    cache = tmp_path / 'cache'
+    monkeypatch.setattr(analyzer, 'rules_cache_location', str(cache / 'rules'))
+    monkeypatch.setattr(analyzer, 'cache_location', str(cache / 'zip_cache.sqlite'))
+    monkeypatch.setattr(analyzer, 'journal_location', str(cache / 'run_journal.jsonl'))
+    monkeypatch.setattr(analyzer, 'history_location', str(cache / 'event_history.sqlite'))
+    monkeypatch.setattr(analyzer, 'date_index_location', str(cache / 'zip_dates.json'))
+    monkeypatch.setattr(analyzer, 'error_matcher', None)
+    monkeypatch.setattr(analyzer, 'run_config', None)
+
+
+@pytest.fixture(scope='session')
+def corpus(tmp_path_factory):
+    """bench.make_corpus with two libraries: nested zips, corrupt zips and a week of logs per machine."""
+    folder = tmp_path_factory.mktemp('corpus')
+    bench.make_corpus(str(folder), scale=2)
+    return str(folder)
+
+
+def run_rows(folder, output, start='2025-06-01', end='none', **kwargs):
+    """Sorted rows of analyze() into a sqlite output."""
+    import sqlite3
+    result = analyzer.analyze(folder, output, start=start, end=end, verbose=False, **kwargs)
+    with sqlite3.connect(output) as connection:
+        rows = connection.execute('SELECT library, machine, date, time, error_type FROM events').fetchall()
+    return result, sorted(rows)
@@ -0,0 +1,102 @@
+import pytest
+
+import Error_log_to_excel as analyzer
+
+
+def seconds(clock):
+    hours, minutes, secs = (int(part) for part in clock.split(':'))
+    return hours*3600 + minutes*60 + secs
+
+
+def rows(*events, machine='L-M1', date='2025-06-06'):
+    """Rows of one log file as match_log_lines gives them, from ('hh:mm:ss', error type) pairs."""
+    return [{'Time': seconds(clock), 'Error Type': error_type, 'Date': date, 'Library': 'L', 'Machine': machine}
+            for clock, error_type in events]
+
+
+def labels(data):
+    return [parsed['Error Type'] for parsed in data]
+
+
+@pytest.fixture
+def run_state(monkeypatch):
+    monkeypatch.setattr(analyzer, 'error_matcher', analyzer.ErrorMatcher(dict(analyzer.default_error_types)))
+    analyzer.reset_run_state()
+    yield
+    analyzer.reset_run_state()
+
+
+def test_first_then_abnormal_boots(run_state):
+    data = rows(('08:00:00', 'boot'), ('09:00:00', 'A1'), ('10:00:00', 'boot'), ('11:00:00', 'boot'))
+    analyzer.classify_boots(data)
+    assert labels(data) == ['First boot', 'A1', 'Abnormal boot', 'Abnormal boot']
+
+
+def test_three_minute_boundary(run_state):
+    data = rows(('08:00:00', 'boot'),
+                ('09:00:00', 'logout(user)'), ('09:03:00', 'boot'),
+                ('10:00:00', 'language_change'), ('10:03:01', 'boot'),
+                ('11:00:00', 'logout(timeout)'), ('11:00:00', 'boot'))
+    analyzer.classify_boots(data)
+    assert labels(data)[::2] == ['First boot', 'Normal boot', 'Abnormal boot', 'Normal boot']
+
+
+def test_remote_restart_is_not_a_normal_shutdown(run_state):
+    data = rows(('08:00:00', 'boot'), ('09:00:00', 'logout(remote)'), ('09:01:00', 'boot'))
+    analyzer.classify_boots(data)
+    assert labels(data) == ['First boot', 'logout(remote)', 'Abnormal boot']
+
+
+def test_state_carried_across_pieces(run_state):
+    events = [('08:00:00', 'boot'), ('08:30:00', 'boot'), ('09:00:00', 'logout(user)'),
+              ('09:02:00', 'boot'), ('10:00:00', 'boot'), ('10:30:00', 'logout(timeout)'), ('10:31:00', 'boot')]
+    whole = rows(*events)
+    assert analyzer.classify_boots(whole) == (seconds('10:30:00'), True)
+    state = (None, False)
+    pieces = []
+    for start in range(0, len(events), 2):
+        piece = rows(*events[start:start + 2])
+        state = analyzer.classify_boots(piece, state)
+        pieces.extend(piece)
+    assert labels(pieces) == labels(whole)
+    assert state == (seconds('10:30:00'), True)
+    #a piece without a boot or logout keeps the state as it is
+    assert analyzer.classify_boots(rows(('12:00:00', 'A1')), state) == state
+    #the first boot of a later piece is not a first boot any more
+    piece = rows(('13:00:00', 'boot'))
+    analyzer.classify_boots(piece, (None, True))
+    assert labels(piece) == ['Abnormal boot']
+
+
+def test_match_remote_restart_passes_over_the_boot_after_a_taken_one():
+    pending = rows(('09:00:00', 'Abnormal boot'), ('09:00:10', 'Abnormal boot'), ('09:00:20', 'Abnormal boot'),
+                   ('09:02:00', 'Abnormal boot'), ('10:00:00', 'Abnormal boot'))
+    taken = analyzer.match_remote_restart(pending, seconds('09:00:30'))
+    #09:00:10 comes right after a taken boot and is passed over, 09:02:00 right after 09:00:20
+    assert [parsed['Time'] for parsed in taken] == [seconds('09:00:00'), seconds('09:00:20')]
+    assert [parsed['Time'] for parsed in pending] == [seconds('09:00:10'), seconds('09:02:00'), seconds('10:00:00')]
+
+
+def test_remote_restart_makes_pending_boots_normal(run_state):
+    data = rows(('08:00:00', 'boot'), ('09:10:00', 'boot'), ('09:10:05', 'boot'), ('09:10:10', 'boot'),
+                ('09:11:00', 'logout(remote)'), ('11:10:00', 'boot'))
+    analyzer.classify_boots(data)
+    analyzer.add_log_data(data)
+    analyzer.add_pending_abnormal_boots()
+    assert sorted(analyzer.all_local_error_logs.iter_rows(), key=lambda row: (row[3], row[4])) == [
+        ('L', 'L-M1', '2025-06-06', '08:00:00', 'First boot'),
+        #the passed over boot stays abnormal, the taken ones get the time of the remote restart
+        ('L', 'L-M1', '2025-06-06', '09:10:05', 'Abnormal boot'),
+        ('L', 'L-M1', '2025-06-06', '09:11:00', 'Normal boot'),
+        ('L', 'L-M1', '2025-06-06', '09:11:00', 'Normal boot'),
+        ('L', 'L-M1', '2025-06-06', '09:11:00', 'logout(remote)'),
+        ('L', 'L-M1', '2025-06-06', '11:10:00', 'Abnormal boot'),
+    ]
+
+
+def test_scheduled_boots_at_the_start_of_an_hour(run_state):
+    data = rows(('07:59:59', 'Abnormal boot'), ('08:00:00', 'Abnormal boot'), ('08:02:59', 'Abnormal boot'),
+                ('08:03:00', 'Abnormal boot'), ('23:01:00', 'Abnormal boot'))
+    analyzer.add_pending_day(data)
+    assert labels(data) == ['Abnormal boot', 'scheduled boot', 'scheduled boot', 'Abnormal boot', 'scheduled boot']
+    assert len(analyzer.all_local_error_logs) == 5
@@ -0,0 +1,31 @@
+import json
+import os
+import shutil
+
+import Error_log_to_excel as analyzer
+from conftest import run_rows
+
+
+def test_invalid_zip_is_not_served_as_skipped(corpus, tmp_path):
+    first, rows = run_rows(corpus, str(tmp_path / 'first.sqlite'))
+    second, cached_rows = run_rows(corpus, str(tmp_path / 'second.sqlite'))
+    assert cached_rows == rows
+    assert sorted(second.invalid_zips) == sorted(first.invalid_zips)
+    assert second.zips_skipped == 0
+    #outside the date range every zip with logs is skipped, the invalid ones still are invalid
+    later, _ = run_rows(corpus, str(tmp_path / 'later.sqlite'), start='2025-07-01')
+    assert later.zips_skipped == len(analyzer.find_zip_files(corpus)) - len(first.invalid_zips)
+    assert sorted(later.invalid_zips) == sorted(first.invalid_zips)
+
+
+def test_date_index_drops_zips_that_are_gone(corpus, tmp_path):
+    folder = str(tmp_path / 'logs')
+    shutil.copytree(corpus, folder)
+    run_rows(folder, str(tmp_path / 'first.sqlite'))
+    gone = os.path.join(folder, '23.7.2025', 'LIB0', 'LIB0-GFK-PAK2.zip')
+    os.remove(gone)
+    run_rows(folder, str(tmp_path / 'second.sqlite'))
+    with open(analyzer.date_index_location, encoding='utf-8') as json_file:
+        date_index = json.load(json_file)
+    assert os.path.abspath(gone) not in date_index
+    assert os.path.abspath(os.path.join(folder, '23.7.2025', 'LIB0', 'LIB0-GFK-PAK3.zip')) in date_index
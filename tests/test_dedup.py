@@ -0,0 +1,73 @@
+import os
+import shutil
+import zipfile
+
+import pytest
+
+import Error_log_to_excel as analyzer
+from conftest import run_rows
+
+
+MODES = [{}, {'workers': 2}, {'prefetch_threads': 2}]
+
+
+def run_mode_rows(folder, output, monkeypatch, mode):
+    monkeypatch.setattr(analyzer, 'prefetch_threads', mode.get('prefetch_threads', 0))
+    return run_rows(folder, output, workers=mode.get('workers', 1))
+
+
+def break_member(zip_path, member):
+    """Store the zip again uncompressed, with a byte of member changed: reading it gives a bad CRC."""
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        files = [(info.filename, zip_ref.read(info)) for info in zip_ref.infolist()]
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zip_ref:
+        for name, data in files:
+            zip_ref.writestr(name, data)
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        info = zip_ref.getinfo(member)
+    with open(zip_path, 'r+b') as f:
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = int.from_bytes(f.read(2), 'little'), int.from_bytes(f.read(2), 'little')
+        f.seek(info.header_offset + 30 + name_length + extra_length + 100)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xff]))
+
+
+@pytest.fixture(scope='module')
+def copied_corpus(corpus, tmp_path_factory):
+    """The corpus with its export folder copied twice, so every log file (nested zips too) is there twice."""
+    folder = tmp_path_factory.mktemp('copied')
+    shutil.copytree(os.path.join(corpus, '23.7.2025'), os.path.join(folder, '23.7.2025'))
+    shutil.copytree(os.path.join(corpus, '23.7.2025'), os.path.join(folder, '24.7.2025'))
+    return str(folder)
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_copied_export_gives_the_rows_once(corpus, copied_corpus, tmp_path, monkeypatch, mode):
+    _, rows = run_rows(corpus, str(tmp_path / 'once.sqlite'))
+    result, copied_rows = run_mode_rows(copied_corpus, str(tmp_path / 'copied.sqlite'), monkeypatch, mode)
+    assert copied_rows == rows
+    #7 days of 5 machines in 2 libraries, nested ones included
+    assert result.duplicate_logs == 70
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_broken_first_copy_parses_the_next_one(corpus, copied_corpus, tmp_path, monkeypatch, mode):
+    folder = str(tmp_path / 'broken')
+    shutil.copytree(copied_corpus, folder)
+    break_member(os.path.join(folder, '23.7.2025', 'LIB0', 'LIB0-GFK-PAK1.zip'), 'Log/2025-06-08_local.log')
+    failing_zip = os.path.join(folder, '23.7.2025', 'LIB1', 'LIB1-GFK-PAK0.zip')
+    process_zip = analyzer.process_zip
+
+    def failing_process_zip(zip_path, *args, **kwargs):
+        if zip_path == failing_zip:
+            raise RuntimeError('unreadable')
+        return process_zip(zip_path, *args, **kwargs)
+
+    monkeypatch.setattr(analyzer, 'use_cache', False)
+    _, rows = run_rows(corpus, str(tmp_path / 'once.sqlite'))
+    monkeypatch.setattr(analyzer, 'process_zip', failing_process_zip)
+    result, broken_rows = run_mode_rows(folder, str(tmp_path / 'broken.sqlite'), monkeypatch, mode)
+    assert broken_rows == rows
+    assert [failed['zip_path'] for failed in result.failed_zips] == [failing_zip]
@@ -0,0 +1,53 @@
+import io
+import zipfile
+
+import pytest
+
+import Error_log_to_excel as analyzer
+
+
+ERROR_TYPES = {'server_down': '服务器断开', 'A1': 'door open', 'restart': '重新启动'}
+
+#a GBK log file as the machines write it: error types in chinese, two bytes that are not GBK in the fourth line
+LOG = (
+    '10:00:00.100 [x] 服务器断开 连接超时\r\n'.encode('gbk') +
+    '10:00:01 [x] INFO 正常运行\r\n'.encode('gbk') +
+    '10:00:02 [x] door open 门已打开\r\n'.encode('gbk') +
+    '10:00:03 [x] 服务器断开 '.encode('gbk') + b'\xff\xff' + ' 重试\r\n'.encode('gbk') +
+    '10:00:04 [x] 系统重新启动'.encode('gbk')
+)
+ROWS = [(36000, 'server_down'), (36002, 'A1'), (36003, 'server_down'), (36004, 'restart')]
+
+
+@pytest.fixture(autouse=True)
+def matcher(monkeypatch):
+    monkeypatch.setattr(analyzer, 'error_matcher', analyzer.ErrorMatcher(ERROR_TYPES))
+
+
+def times_and_types(data):
+    return [(parsed['Time'], parsed['Error Type']) for parsed in data]
+
+
+@pytest.mark.parametrize('block_size', [analyzer.log_block_size, 16])
+def test_gbk_log_stream(monkeypatch, block_size):
+    monkeypatch.setattr(analyzer, 'log_block_size', block_size)
+    counters = analyzer.new_log_counters()
+    data = analyzer.match_log_stream(io.BytesIO(LOG), '2025-06-06', 'L', 'L-M1', counters)
+    assert times_and_types(data) == ROWS
+    assert counters['encoding'] == 'gb18030'
+    assert counters['undecodable_bytes'] == 2
+    assert counters['lines'] == 5
+
+
+def test_gbk_log_in_a_zip(tmp_path, monkeypatch):
+    monkeypatch.setattr(analyzer, 'collect_metrics', True)
+    monkeypatch.setattr(analyzer, 'start_date', '2025-06-01')
+    monkeypatch.setattr(analyzer, 'end_date', 'none')
+    zip_path = str(tmp_path / 'L-M1.zip')
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr('Log/2025-06-06_local.log', LOG)
+    result = analyzer.process_zip(zip_path)
+    assert times_and_types(result['log_data']) == ROWS
+    log_file, = result['metrics']['log_files']
+    assert (log_file['encoding'], log_file['undecodable_bytes']) == ('gb18030', 2)
+    assert result['metrics']['undecodable_bytes'] == 2
@@ -0,0 +1,74 @@
+import re
+
+import pytest
+
+import Error_log_to_excel as analyzer
+
+D = analyzer.default_error_types
+
+lines = [
+    '10:00:00.123 [x] ' + D['A1'],
+    '10:00:01 [x] ' + D['boot'] + ' trailing text',
+    #several error types in one line: the first in config order wins, wherever it is in the line
+    '10:00:02 [x] ' + D['logout(user)'] + ' then ' + D['A2'],
+    '10:00:03 [x] ' + D['B2'] + D['language_change'],
+    D['logout(remote)'] + ' without a time',
+    '10:00:04 [x] INFO something normal happened 正常',
+    '10:00:05 [x] 检测服务器状态：True',
+    '',
+    '   ',
+    'garbage line without time',
+]
+
+
+def legacy_error_type(message, error_types):
+    """get_error_type before ErrorMatcher: one re.search per error type, in config order."""
+    for error in error_types:
+        if re.search(error_types[error], message):
+            return error
+    return False
+
+
+def check_same_as_legacy(error_types, test_lines):
+    matcher = analyzer.ErrorMatcher(error_types)
+    for line in test_lines:
+        assert matcher.match(line) == legacy_error_type(line, error_types), line
+
+
+def test_default_error_types():
+    check_same_as_legacy(dict(D), lines)
+
+
+def test_config_order_decides():
+    check_same_as_legacy(dict(reversed(list(D.items()))), lines)
+
+
+def test_overlapping_patterns():
+    error_types = {'short': r'err', 'long': r'error \d+', 'word': r'\berror\b', 'any': r'.'}
+    test_lines = ['x', 'error 42', 'an error', 'terror', 'err', 'ERROR 1', '']
+    check_same_as_legacy(error_types, test_lines)
+    check_same_as_legacy(dict(reversed(list(error_types.items()))), test_lines)
+
+
+def test_group_patterns_take_the_fallback_path():
+    error_types = {'repeat': r'(ab)\1', 'alternative': r'(?:x|y)z', 'plain': 'abab'}
+    matcher = analyzer.ErrorMatcher(error_types)
+    assert matcher.any_regex is None
+    check_same_as_legacy(error_types, ['abab', 'ab ab', 'yz', 'xz abab', 'nothing'])
+
+
+def test_rejected_lines():
+    matcher = analyzer.ErrorMatcher(dict(D))
+    assert matcher.any_regex is not None
+    for line in ('10:00:04 [x] INFO something normal happened 正常', '', 'garbage line without time'):
+        assert matcher.match(line) is False
+
+
+def test_no_error_types():
+    assert analyzer.ErrorMatcher({}).match('anything') is False
+
+
+@pytest.mark.parametrize('line', lines)
+def test_get_error_type(line, monkeypatch):
+    monkeypatch.setattr(analyzer, 'error_matcher', analyzer.ErrorMatcher(dict(D)))
+    assert analyzer.get_error_type(line) == legacy_error_type(line, D)
@@ -0,0 +1,108 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+import Error_log_to_excel as analyzer
+
+
+def rule(name, pattern, **keys):
+    return dict(name=name, pattern=pattern, **keys)
+
+
+def test_every_problem_is_listed():
+    rule_set = {'name': 'bad', 'rules': [
+        rule('a', 'x', colour='red'),
+        rule('a', 'y'),
+        rule('b', 'z', literal='yes'),
+        rule('c', 'z', priority=1.5),
+        rule('d', 'z', role='crash'),
+        rule('e', '(unclosed'),
+        rule('f', ''),
+        'not a rule',
+    ]}
+    with pytest.raises(ValueError) as error:
+        analyzer.validate_rule_set(rule_set)
+    assert str(error.value) == (
+        'rule set bad: rule 1 (a): unknown key "colour"; rule 2 (a): name used twice; '
+        'rule 3 (b): "literal" must be true or false; rule 4 (c): "priority" must be a whole number; '
+        'rule 5 (d): role must be one of boot, normal_shutdown, remote_restart; '
+        'rule 6 (e): pattern is not a valid regex (missing ), unterminated subpattern at position 0); '
+        'rule 7 (f): needs a non empty "pattern"; rule 8 is not an object')
+
+
+def test_rule_set_needs_a_name_and_rules():
+    with pytest.raises(ValueError, match='a rule set is a json object'):
+        analyzer.validate_rule_set(['a', 'b'])
+    with pytest.raises(ValueError, match=r'needs a "name" \(text without /\); "rules" must be a list'):
+        analyzer.validate_rule_set({'name': 'a/b', 'rules': {}})
+
+
+def test_roles_only_in_the_first_set():
+    first = {'name': 'first', 'rules': [rule('boot', 'started', role='boot')]}
+    second = {'name': 'second', 'rules': [rule('boot', 'started', role='boot')]}
+    with pytest.raises(ValueError, match=r'rule set second: rule 1 \(boot\): roles are only read from the first rule set'):
+        analyzer.ErrorMatcher(rule_sets=[first, second])
+    with pytest.raises(ValueError, match='rule set names used twice: first'):
+        analyzer.ErrorMatcher(rule_sets=[first, dict(first, rules=[rule('x', 'y')])])
+
+
+def test_priority_then_file_order():
+    rule_set = {'name': 'set', 'rules': [
+        rule('low', 'disk'),
+        rule('high', 'full', priority=5),
+        rule('also low', 'disk full'),
+        rule('higher', 'fan', priority=9, literal=True),
+    ]}
+    matcher = analyzer.ErrorMatcher(rule_sets=[rule_set])
+    assert [name for name, _ in matcher.error_types] == ['higher', 'high', 'low', 'also low']
+    assert matcher.match('10:00:00 disk full') == 'high'
+    assert matcher.match('10:00:00 disk full, fan stopped') == 'higher'
+    assert matcher.match('10:00:00 disk almost full') == 'high'
+    assert matcher.match('10:00:00 disk ok') == 'low'
+    assert matcher.match('10:00:00 all ok') is False
+
+
+def test_several_rule_sets(monkeypatch):
+    primary = {'name': 'main', 'rules': [
+        rule('boot', 'system started', literal=True, role='boot'),
+        rule('logout', 'user logged out', literal=True, role='normal_shutdown'),
+        rule('jam', r'jam \d+', priority=1),
+    ]}
+    extra = {'name': 'hardware', 'rules': [rule('motor', 'motor'), rule('jam', 'jam', priority=2)]}
+    matcher = analyzer.ErrorMatcher(rule_sets=[primary, extra])
+    assert matcher.set_names == ('main', 'hardware')
+    #the rules of the other sets get the set name in front, roles only come from the first set
+    assert [name for name, _ in matcher.error_types] == ['jam', 'boot', 'logout', 'hardware/jam', 'hardware/motor']
+    assert matcher.boot_types == ('boot',)
+    assert matcher.normal_shutdown_types == ('logout',)
+    assert matcher.match_all('10:00:00 motor jam 3') == ['jam', 'hardware/jam']
+    assert matcher.match_all('10:00:00 motor stopped') == ['hardware/motor']
+    assert matcher.match_all('10:00:00 system started') == ['boot']
+    assert matcher.match('10:00:00 motor stopped') is False
+    #a row for every rule set with an error type in the line
+    monkeypatch.setattr(analyzer, 'error_matcher', matcher)
+    rows = analyzer.match_log_lines(['10:00:00 motor jam 3\n', '10:00:01 nothing\n'], '2025-06-06', 'L', 'L-M1')
+    assert [(row['Time'], row['Error Type']) for row in rows] == [(36000, 'jam'), (36000, 'hardware/jam')]
+
+
+def test_error_types_file_as_a_rule_set(tmp_path):
+    path = tmp_path / 'mine.json'
+    path.write_text(json.dumps({'A1': 'door open', 'boot': 'system started'}))
+    rule_set = analyzer.read_rule_set(str(path))
+    assert rule_set['name'] == 'mine'
+    assert [(r['name'], r['role']) for r in rule_set['rules']] == [('A1', None), ('boot', 'boot')]
+    path.write_text('{"name": ')
+    with pytest.raises(ValueError, match='mine.json is not valid json'):
+        analyzer.read_rule_set(str(path))
+
+
+def test_run_with_a_bad_rule_set_fails_cleanly(corpus, tmp_path):
+    path = tmp_path / 'bad.json'
+    path.write_text(json.dumps({'name': 'bad', 'rules': [rule('a', '(unclosed')]}))
+    completed = subprocess.run([sys.executable, analyzer.__file__, '-i', corpus, '-o', str(tmp_path / 'out.sqlite'), '--rules', str(path)],
+                               capture_output=True, text=True, cwd=tmp_path)
+    assert completed.returncode == 1
+    assert 'Failure: rule set bad: rule 1 (a): pattern is not a valid regex' in completed.stdout
+    assert 'Traceback' not in completed.stderr
@@ -0,0 +1,62 @@
+import os
+import time
+
+import pytest
+
+import Error_log_to_excel as analyzer
+from conftest import run_rows
+
+
+@pytest.mark.parametrize('workers, settings', [
+    (2, {}),
+    (1, {'prefetch_threads': 2}),
+    (1, {'chunk_workers': 2, 'chunk_threshold_mb': 0}),
+    (2, {'chunk_workers': 2, 'chunk_threshold_mb': 0}),
+], ids=['workers', 'prefetch', 'chunked', 'workers_chunked'])
+def test_run_modes_give_the_serial_rows(corpus, tmp_path, monkeypatch, workers, settings):
+    monkeypatch.setattr(analyzer, 'use_cache', False)
+    serial, serial_rows = run_rows(corpus, str(tmp_path / 'serial.sqlite'))
+    for name, value in settings.items():
+        monkeypatch.setattr(analyzer, name, value)
+    result, rows = run_rows(corpus, str(tmp_path / 'mode.sqlite'), workers=workers)
+    assert rows == serial_rows
+    assert result.machines == serial.machines
+    assert sorted(result.invalid_zips) == sorted(serial.invalid_zips)
+
+
+def test_worker_dying_while_zips_are_submitted(corpus, tmp_path, monkeypatch):
+    parent = os.getpid()
+    process_zip = analyzer.process_zip
+    zip_memory_cost = analyzer.zip_memory_cost
+
+    def crashing_process_zip(zip_path, *args, **kwargs):
+        if os.getpid() != parent:
+            if zip_path.endswith('LIB0-GFK-PAK1.zip'):
+                os._exit(1)
+            #the zips before it are still running when its worker dies, so the merge is not waiting on it
+            time.sleep(0.5)
+        elif zip_path.endswith('LIB0-GFK-PAK1.zip'):
+            raise RuntimeError('crashed')
+        return process_zip(zip_path, *args, **kwargs)
+
+    def slow_zip_memory_cost(*args):
+        #the pool is found broken by the submit of the next zip
+        time.sleep(0.3)
+        return zip_memory_cost(*args)
+
+    monkeypatch.setattr(analyzer, 'use_cache', False)
+    monkeypatch.setattr(analyzer, 'process_zip', crashing_process_zip)
+    monkeypatch.setattr(analyzer, 'zip_memory_cost', slow_zip_memory_cost)
+    serial, serial_rows = run_rows(corpus, str(tmp_path / 'serial.sqlite'))
+    parallel, parallel_rows = run_rows(corpus, str(tmp_path / 'workers.sqlite'), workers=2)
+    assert parallel_rows == serial_rows
+    assert [failed['zip_path'] for failed in parallel.failed_zips] == [failed['zip_path'] for failed in serial.failed_zips]
+    assert parallel.failed_zips[0]['error'] == 'BrokenProcessPool'
+
+
+def test_output_without_a_folder(corpus, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _, rows = run_rows(corpus, str(tmp_path / 'folder.sqlite'))
+    _, bare_rows = run_rows(corpus, 'bare.sqlite')
+    assert bare_rows == rows
+    assert os.path.isfile(tmp_path / 'bare.sqlite')
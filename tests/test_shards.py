@@ -0,0 +1,59 @@
+import gzip
+import random
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import Error_log_to_excel as analyzer
+from conftest import run_rows
+
+
+def write_shards(folder, output, count, monkeypatch):
+    """Partials of every shard of folder, by machine."""
+    monkeypatch.setattr(analyzer, 'shard_by', 'machine')
+    paths = []
+    for number in range(1, count + 1):
+        monkeypatch.setattr(analyzer, 'shard', (number, count))
+        analyzer.analyze(folder, output, start='2025-06-01', end='none', verbose=False)
+        paths.append(analyzer.shard_partial_path(output))
+    monkeypatch.setattr(analyzer, 'shard', None)
+    return paths
+
+
+def test_merged_shards_give_the_serial_rows(corpus, tmp_path, monkeypatch):
+    _, rows = run_rows(corpus, str(tmp_path / 'serial.sqlite'))
+    paths = write_shards(corpus, str(tmp_path / 'sharded.sqlite'), 3, monkeypatch)
+    random.Random(1).shuffle(paths)
+    merged = str(tmp_path / 'merged.sqlite')
+    analyzer.merge_partials(paths, merged)
+    with sqlite3.connect(merged) as connection:
+        merged_rows = connection.execute('SELECT library, machine, date, time, error_type FROM events').fetchall()
+    assert sorted(merged_rows) == rows
+
+
+def test_merge_of_a_bad_file(corpus, tmp_path, monkeypatch):
+    paths = write_shards(corpus, str(tmp_path / 'sharded.sqlite'), 2, monkeypatch)
+    not_gzip = tmp_path / 'not_gzip.json.gz'
+    not_gzip.write_text('{"partial": 1}\n')
+    with pytest.raises(ValueError, match='is not a partial'):
+        analyzer.merge_partials([paths[0], str(not_gzip)], str(tmp_path / 'merged.sqlite'))
+    no_header = tmp_path / 'no_header.json.gz'
+    with gzip.open(no_header, 'wt') as partial_file:
+        partial_file.write('{"partial": 1}\n')
+    with pytest.raises(ValueError, match='no shard, shards'):
+        analyzer.merge_partials([paths[0], str(no_header)], str(tmp_path / 'merged.sqlite'))
+    #cut short: the header is fine, the zip entries are not
+    with gzip.open(paths[1], 'rb') as partial_file:
+        data = partial_file.read()
+    with open(paths[1], 'wb') as partial_file:
+        partial_file.write(gzip.compress(data)[:-200])
+    with pytest.raises(ValueError, match='is damaged'):
+        analyzer.merge_partials(paths, str(tmp_path / 'merged.sqlite'))
+    #--merge prints it as a failure, without a traceback
+    completed = subprocess.run([sys.executable, analyzer.__file__, '--merge', paths[0], str(not_gzip), '-o', str(tmp_path / 'merged.sqlite')],
+                               capture_output=True, text=True, cwd=tmp_path)
+    assert completed.returncode == 1
+    assert 'Failure: ' in completed.stdout and 'is not a partial' in completed.stdout
+    assert 'Traceback' not in completed.stderr